@@ -0,0 +1,208 @@
+"""
+Benchmarks of the degradation functions and the calculation of the supply chain visibility.
+
+Run from the root of the repository:
+    python benchmarks/run_benchmarks.py                       #bundled data and small synthetic data sets
+    python benchmarks/run_benchmarks.py --full                #synthetic data sets up to 1M rows and 500 actors
+    python benchmarks/run_benchmarks.py --save baseline.json  #store the results as baseline
+    python benchmarks/run_benchmarks.py --compare baseline.json
+
+Every benchmark reports its best time over the repeats, the throughput (cells or seeds per second) and the peak
+memory of one extra run traced with tracemalloc.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from degrade_data.missing_data import delete_values_completely_random
+from degrade_data.noise_data import assign_noise
+from degrade_data.bias_data import sample_bias, assign_bias
+from calculate_scv import calculate_supply_chain_visibility, run_scenario_sweep, degrade_scenario_array
+from ground_truth import GroundTruthProfile
+from windowed_scv import RollingSCV, rolling_visibility
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data",
+                         "20221005_GT_TimeSeries_ManufacturingTime2.5_Runtime364.csv")
+LEVELS_BUNDLED = [1, 2, 2, 3, 4, 5, 5, 6, 7, 7, 7]
+
+#Percentage regimes: low, half and almost all of the data degraded
+PERCENTAGES = [0.1, 0.5, 0.95]
+
+SIZES_QUICK = [(10000, 10), (100000, 50)]
+SIZES_FULL = [(10000, 10), (10000, 500), (100000, 50), (1000000, 10), (1000000, 50)]
+
+#Rolling window and number of time steps per update of the live feed
+WINDOW = 30
+FEED_SIZES = [1, 7, 29]
+
+
+def bundled_ground_truth():
+    """ Ground truth of the bundled time series: the mean per time step over the replications. """
+    df_in = pd.read_csv(DATA_FILE)
+    ground_truth = df_in.set_index("Time").groupby(["Time"]).mean().iloc[:, 1:-1]
+    ground_truth.iloc[0, 0] = 0
+    return ground_truth
+
+def synthetic_ground_truth(rows, actors, seed=0):
+    """ Synthetic ground truth with the inventory of the actors (Gamma distributed) and two trailing columns, which
+    the degradation functions leave out like the last two columns of the bundled data. """
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame(rng.gamma(2.0, 50.0, size=(rows, actors)),
+                         columns=["Actor_{0}".format(actor) for actor in range(actors)])
+    frame["Scenario"] = 0.0
+    frame["Replication"] = 1.0
+    return frame
+
+def data_sets(full=False, sizes=None):
+    """ Name, ground truth, names and levels of the nodes of the data sets to benchmark. """
+    ground_truth = bundled_ground_truth()
+    yield "bundled", ground_truth, list(ground_truth.columns), LEVELS_BUNDLED
+
+    for rows, actors in sizes or (SIZES_FULL if full else SIZES_QUICK):
+        ground_truth = synthetic_ground_truth(rows, actors)
+        names_nodes = list(ground_truth.columns[:-2])
+        yield "{0}x{1}".format(rows, actors), ground_truth, names_nodes, [1] * len(names_nodes)
+
+def measure(function, repeat):
+    """ Best wall time over the repeats and the peak memory (in bytes) of one run traced with tracemalloc. """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return min(times), peak
+
+def rolling_feed(full_values, degraded_values, names_nodes, window, size):
+    """ Rolling visibility per node and global visibility of a live feed that delivers size time steps per update. """
+    rolling = RollingSCV(names_nodes, window)
+    updates = [rolling.update(full_values[start:start + size], degraded_values[start:start + size])
+               for start in range(0, len(full_values), size)]
+    return np.concatenate([scv for scv, global_scv in updates]), \
+        np.concatenate([global_scv for scv, global_scv in updates])
+
+def benchmarks(name, ground_truth, names_nodes, levels_nodes, seeds):
+    """ Benchmarks of one data set as tuples of the name of the benchmark, the function, the amount of work and its
+    unit. """
+    data = ground_truth.iloc[:, :-2]
+    cells = data.size
+    profile = GroundTruthProfile(ground_truth)
+
+    for percentage in PERCENTAGES:
+        rng = np.random.default_rng(1)
+        yield ("missing", name, percentage), \
+            lambda: delete_values_completely_random(percentage, data, rng=rng), cells, "cells"
+        yield ("noise", name, percentage), lambda: assign_noise(percentage, data, rng=rng), cells, "cells"
+        yield ("sample_bias", name, percentage), lambda: sample_bias(data, percentage, rng=rng), cells, "cells"
+        #assign_bias changes the data frame in place, so it works on a copy
+        yield ("assign_bias", name, percentage), \
+            lambda: assign_bias(data.copy(), percentage, True, rng=rng), cells, "cells"
+
+        for dimension in ["missing", "noise", "bias"]:
+            yield ("scv_" + dimension, name, percentage), \
+                lambda: calculate_supply_chain_visibility(profile, percentage, names_nodes, levels_nodes, dimension,
+                                                          seed=1), cells, "cells"
+
+    scenarios = {"low": {"noise": [0.1] * len(names_nodes), "missing": [0.25] * len(names_nodes)},
+                 "high": {"noise": [0.8] * len(names_nodes), "missing": [0.95] * len(names_nodes)}}
+    full_frame = ground_truth[names_nodes]
+    degraded_values = degrade_scenario_array(full_frame.to_numpy(dtype=float, copy=True), [0.3] * len(names_nodes),
+                                             [0.3] * len(names_nodes), rng=np.random.default_rng(1),
+                                             bias_columns=np.arange(len(names_nodes)))
+    degraded_frame = pd.DataFrame(degraded_values, index=full_frame.index, columns=names_nodes)
+    yield ("rolling_scv", name, WINDOW), \
+        lambda: rolling_visibility(full_frame, degraded_frame, names_nodes, WINDOW), cells, "cells"
+    #Updates of one time step are slow on the large data sets, so the live feed only runs on the small ones
+    if len(full_frame) <= 10000:
+        for size in FEED_SIZES:
+            yield ("rolling_feed", name, size), \
+                lambda: rolling_feed(full_frame.to_numpy(dtype=float), degraded_frame.to_numpy(dtype=float),
+                                     names_nodes, WINDOW, size), cells, "cells"
+
+    yield ("scenario_sweep", name, len(seeds)), \
+        lambda: run_scenario_sweep(profile, scenarios, names_nodes, levels_nodes, seeds=seeds, executor="serial"), \
+        len(scenarios) * len(seeds), "seeds"
+
+def run(full=False, sizes=None, repeat=3, seeds=range(1, 201), select=None):
+    """ Run the benchmarks and return a dictionary with the result per benchmark. """
+    results = {}
+    for name, ground_truth, names_nodes, levels_nodes in data_sets(full, sizes):
+        for key, function, work, unit in benchmarks(name, ground_truth, names_nodes, levels_nodes, list(seeds)):
+            label = "{0}[{1}, {2}]".format(*key)
+            if select and select not in label:
+                continue
+            best, peak = measure(function, repeat)
+            results[label] = {"seconds": best, "throughput": work / best, "unit": unit + "/s", "peak_bytes": peak}
+            print("{0:<45} {1:>10.4f} s {2:>14.4g} {3:<8} {4:>10.1f} MB".format(label, best, work / best,
+                                                                              unit + "/s", peak / 2 ** 20))
+            sys.stdout.flush()
+
+    return results
+
+def compare(results, baseline, tolerance):
+    """ Compare the throughput with a baseline. Returns the labels of the benchmarks that are more than the
+    tolerance slower than the baseline. """
+    regressions = []
+    print("\n{0:<45} {1:>10} {2:>10} {3:>8}".format("benchmark", "baseline", "current", "ratio"))
+    for label, result in results.items():
+        if label not in baseline["results"]:
+            continue
+        ratio = result["throughput"] / baseline["results"][label]["throughput"]
+        flag = ""
+        if ratio < 1 - tolerance:
+            regressions.append(label)
+            flag = "  REGRESSION"
+        print("{0:<45} {1:>10.4g} {2:>10.4g} {3:>8.2f}{4}".format(label, baseline["results"][label]["throughput"],
+                                                                   result["throughput"], ratio, flag))
+
+    return regressions
+
+def parse_size(size):
+    rows, actors = size.lower().split("x")
+    return int(rows), int(actors)
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the degradation and the supply chain visibility.")
+    parser.add_argument("--full", action="store_true", help="synthetic data sets up to 1M rows and 500 actors")
+    parser.add_argument("--sizes", nargs="+", type=parse_size, help="synthetic sizes as ROWSxACTORS, e.g. 10000x10")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs per benchmark")
+    parser.add_argument("--seeds", type=int, default=200, help="number of seeds of the scenario sweep")
+    parser.add_argument("--select", help="only run the benchmarks of which the label contains this text")
+    parser.add_argument("--save", help="store the results as baseline in this json file")
+    parser.add_argument("--compare", help="compare the results with the baseline in this json file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative loss of throughput")
+    arguments = parser.parse_args(arguments)
+
+    results = run(arguments.full, arguments.sizes, arguments.repeat, range(1, arguments.seeds + 1), arguments.select)
+
+    if arguments.save:
+        with open(arguments.save, "w") as baseline_file:
+            json.dump({"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+                       "machine": platform.machine(), "results": results}, baseline_file, indent=2)
+
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), arguments.tolerance)
+        if regressions:
+            print("\n{0} benchmark(s) slower than the baseline".format(len(regressions)))
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,13 +6,22 @@ Created on: 12-7-2021 13:22
 
 import pandas as pd
 import numpy as np
-import random
+import os
 import math
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
 from collections import defaultdict
+from functools import partial
 
 from degrade_data.missing_data import delete_values_completely_random
-from degrade_data.noise_data import assign_noise
+from degrade_data.noise_data import assign_noise, noise_in_numbers, shift_numbers
 from degrade_data.bias_data import assign_bias, sample_bias
+from degrade_data.cache_data import cached_degradation
+from degrade_data.sampling import get_generator
+from degrade_data.instrumentation import stage
+from ground_truth import GroundTruthProfile, SharedGroundTruth
+from expected_scv import expected_supply_chain_visibility
+from sweep_result import RunningStatistics, SweepResult
 
 
 class Node(object):
@@ -23,9 +32,19 @@ class Node(object):
         self.quantity = 0
         self.quality = 0
 
+        #The full data set is either a data frame or a GroundTruthProfile with precomputed constants
+        self.full_count = None
+        if isinstance(full_data_set, GroundTruthProfile):
+            position = full_data_set.columns.index(name)
+            self.full_count = full_data_set.full_count[position]
+            average_inventory = full_data_set.average_inventory[position]
+            full_data_set = full_data_set.frame
+        else:
+            average_inventory = np.mean(full_data_set[name])
+
         self.scv = self.calculate_visibility_per_node(full_data_set[name], data_set[name])
 
-        self.average_inventory = np.mean(full_data_set[name])
+        self.average_inventory = average_inventory
 
     def calculate_visibility_per_node(self, full_data_node, data_set_node):
         """ Calculate the visibility of one node based on the quantity and the quality of the data set. The visibility
@@ -40,7 +59,8 @@ class Node(object):
 
     def calculate_quantity_per_node(self, full_data_node, data_set_node):
         """" Quantity is the percentage of data points compared to the full data set. """
-        percentage_quantity = (data_set_node.count() / full_data_node.count()) * 100
+        full_count = self.full_count if self.full_count is not None else full_data_node.count()
+        percentage_quantity = (data_set_node.count() / full_count) * 100
         self.quantity = percentage_quantity
         return self.quantity
 
@@ -63,92 +83,632 @@ class Node(object):
         return mape
 
 
-def create_missing_value_df(data_frame, percentage,**kwargs):
-    """Create missing values in a data frame based on the user-defined percentage."""
-    random.seed(2)
-    if "seed" in kwargs:
-        random.seed(kwargs["seed"])
-        #print("Seed is", kwargs["seed"])
+class NodeResult(object):
+    """ Lightweight record of the visibility of one node, with the same attributes as a `Node`. """
+    __slots__ = ("name", "level", "quantity", "quality", "scv", "average_inventory")
+
+    def __init__(self, name, level, quantity, quality, scv, average_inventory):
+        self.name = name
+        self.level = level
+        self.quantity = quantity
+        self.quality = quality
+        self.scv = scv
+        self.average_inventory = average_inventory
+
+    def __repr__(self):
+        return "NodeResult(name={0!r}, scv={1:.3f}, quantity={2:.3f}, quality={3:.3f})".format(
+            self.name, self.scv, self.quantity, self.quality)
+
+
+def visibility_statistics(full_values, degraded_values, full_constants=None):
+    """ Sums per node that determine its visibility, for 2-D float arrays with the time steps as rows and the nodes
+    as columns (more leading dimensions are allowed). Missing values are NaN. The quality only uses the rows in
+    which both the full and the degraded value are present. The count and sum of the full data set are taken from
+    full_constants when they are precomputed (see `ground_truth.ground_truth_constants`). """
+    full_present = ~np.isnan(full_values)
+    degraded_present = ~np.isnan(degraded_values)
+    joint = full_present & degraded_present
+
+    actual = np.where(joint, full_values, 0)
+    predicted = np.where(joint, degraded_values, 0)
+
+    if full_constants is None:
+        full_count = full_present.sum(axis=-2)
+        inventory_sum = np.where(full_present, full_values, 0).sum(axis=-2)
+    else:
+        full_count = full_constants["full_count"]
+        inventory_sum = full_constants["inventory_sum"]
+
+    return {"full_count": full_count,
+            "degraded_count": degraded_present.sum(axis=-2),
+            "joint_count": joint.sum(axis=-2),
+            "joint_zero_count": (joint & (actual == 0) & (predicted == 0)).sum(axis=-2),
+            "actual_sum": actual.sum(axis=-2),
+            "absolute_error_sum": np.abs(actual - predicted).sum(axis=-2),
+            "inventory_sum": inventory_sum}
+
+def finalize_visibility(statistics):
+    """ Quantity, quality, visibility and average inventory per node from the sums of `visibility_statistics`,
+    following the definitions of `Node`. The mean absolute percentage error divides the absolute error by the mean
+    of the actual values, which reduces to the sum of the absolute errors divided by the sum of the actual values. """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        quantity = statistics["degraded_count"] / statistics["full_count"] * 100
+
+        all_zero = statistics["joint_zero_count"] == statistics["joint_count"]
+        mape = np.where(all_zero, 0, statistics["absolute_error_sum"] / np.abs(statistics["actual_sum"]) * 100)
+        quality = 100 - mape
+
+        scv = np.sqrt(quantity * np.where(quality > 0, quality, 0)) #cannot be below zero
+        average_inventory = statistics["inventory_sum"] / statistics["full_count"]
+
+    return quantity, quality, scv, average_inventory
+
+def weight_visibility(scv, average_inventory):
+    """ The global measure for the level of visibility is the average of the visibility of the nodes, weighted by
+    their average inventory. """
+    norm_weights = average_inventory / np.sum(average_inventory, axis=-1, keepdims=True)
+    return np.sum(scv * norm_weights, axis=-1)
+
+def calculate_scv_degraded(full_data_set, data_set, names_nodes, levels_nodes):
+    """ Calculate the supply chain visibility of an already degraded data set against the full data set in one
+    array pass over all nodes, instead of creating a `Node` per name. When the full data set is a
+    `GroundTruthProfile`, its constants are reused. Returns the global visibility and a `NodeResult` per node. """
+    full_constants = None
+    if isinstance(full_data_set, GroundTruthProfile):
+        full_constants = full_data_set.node_constants(names_nodes)
+        full_data_set = full_data_set.frame
+
+    full_frame = full_data_set[names_nodes]
+    degraded_frame = data_set[names_nodes]
+    if not full_frame.index.equals(degraded_frame.index):
+        full_frame, degraded_frame = full_frame.align(degraded_frame, join="outer", axis=0)
+
+    return calculate_scv_arrays(full_frame.to_numpy(dtype=float), degraded_frame.to_numpy(dtype=float), names_nodes,
+                                levels_nodes, full_constants)
+
+def calculate_scv_arrays(full_values, degraded_values, names_nodes, levels_nodes, full_constants=None):
+    """ Calculate the supply chain visibility from 2-D float arrays with a column per node, in the order of the
+    names. Returns the global visibility and a `NodeResult` per node. """
+    with stage("score", cells=degraded_values.size):
+        statistics = visibility_statistics(full_values, degraded_values, full_constants)
+        quantity, quality, scv, average_inventory = finalize_visibility(statistics)
+
+    with stage("weight", cells=len(names_nodes)):
+        nodes = [NodeResult(*node) for node in zip(names_nodes, levels_nodes, quantity.tolist(), quality.tolist(),
+                                                   scv.tolist(), average_inventory.tolist())]
+        scv_weight_inventory = float(weight_visibility(scv, average_inventory))
+
+    return scv_weight_inventory, nodes
+
+
+def create_missing_value_df(data_frame, percentage, rng=None, **kwargs):
+    """Create missing values in a data frame based on the user-defined percentage. The cells are drawn from the given
+    Numpy Generator, or otherwise from a generator seeded with the seed (default 2)."""
+    rng = get_generator(rng if rng is not None else kwargs.get("seed", 2))
 
     #print("Percentage of missing values is " + str(percentage))
     data_frame_data = data_frame.iloc[:, :-2]
     data_frame_scenrep = data_frame.iloc[:, -2:]
 
-    missing_values = delete_values_completely_random(percentage, data_frame_data)
+    missing_values = delete_values_completely_random(percentage, data_frame_data, rng=rng)
     total_missing_values = pd.concat([missing_values, data_frame_scenrep], axis=1)
 
     return total_missing_values
 
-def create_noise_df(data_frame, percentage,**kwargs):
-    """Create noise in a data frame based on the user-defined percentage."""
-    random.seed(2)
-    np.random.seed(2)
-    if "seed" in kwargs:
-        random.seed(kwargs["seed"])
-        np.random.seed(kwargs["seed"])
-        #print("Seed is", kwargs["seed"])
+def create_noise_df(data_frame, percentage, rng=None, **kwargs):
+    """Create noise in a data frame based on the user-defined percentage. The cells and the noise are drawn from the
+    given Numpy Generator, or otherwise from a generator seeded with the seed (default 2)."""
+    rng = get_generator(rng if rng is not None else kwargs.get("seed", 2))
 
     #print("Percentage of noise is " + str(percentage))
     data_frame_data = data_frame.iloc[:, :-2]
     data_frame_scenrep = data_frame.iloc[:, -2:]
 
-    noise_df = assign_noise(percentage, data_frame_data)
+    noise_df = assign_noise(percentage, data_frame_data, rng=rng)
     total_noise_df = pd.concat([noise_df, data_frame_scenrep], axis=1)
 
     return total_noise_df
 
-def create_bias_df(data_frame, percentage, **kwargs):
-    """Create bias in a data frame based on the user-defined percentage."""
-    np.random.seed(2)
-    if "seed" in kwargs:
-        np.random.seed(kwargs["seed"])
-        #print("Seed is", kwargs["seed"])
+def create_bias_df(data_frame, percentage, rng=None, **kwargs):
+    """Create bias in a data frame based on the user-defined percentage. The rows are drawn from the given Numpy
+    Generator, or otherwise from a generator seeded with the seed (default 2)."""
+    rng = get_generator(rng if rng is not None else kwargs.get("seed", 2))
 
     #print("Percentage of bias is " + str(percentage))
     data_frame_data = data_frame.iloc[:, :-2]
     data_frame_scenrep = data_frame.iloc[:, -2:]
 
-    bias_df = sample_bias(data_frame_data, percentage)
+    bias_df = sample_bias(data_frame_data, percentage, rng=rng)
     total_bias_df = pd.concat([bias_df, data_frame_scenrep], axis=1)
 
     return total_bias_df
 
 
-def calculate_supply_chain_visibility(data_set, percentage_missing, names_nodes, levels_nodes, dim_sparseness="missing",
-                                      seed=2):
-    """ Data set and percentage of missing values to calculate supply chain visibility for.
-    The global measure for the level of visibility is the weighted average of the metrics assessed for each node."""
+def create_degraded_df(data_set, percentage, dim_sparseness="missing", seed=2, rng=None):
+    """Degrade a data set on one dimension of data sparseness with the user-defined percentage. The random draws come
+    from the given Numpy Generator (or SeedSequence), or otherwise from a generator seeded with the seed."""
+    rng = get_generator(rng if rng is not None else seed)
 
     #TODO change this to missing value, noise and bias (and relevance)
-    if str.lower(dim_sparseness) == "noise":
-        df_degrade_data = create_noise_df(data_set, percentage=percentage_missing, seed=seed)
-        df_degrade_data.iloc[:, 1:] = df_degrade_data.iloc[:, 1:].apply(pd.to_numeric)
-    if str.lower(dim_sparseness) == "missing":
-        df_degrade_data = create_missing_value_df(data_set, percentage=percentage_missing, seed=seed)
-        df_degrade_data.iloc[:, 1:] = df_degrade_data.iloc[:, 1:].apply(pd.to_numeric)
-    if str.lower(dim_sparseness) == "relevance":
-        df_degrade_data = create_relevance_df(data_set, percentage=percentage_missing, seed=seed)
-        df_degrade_data.iloc[:, 1:] = df_degrade_data.iloc[:, 1:].apply(pd.to_numeric)
-    if str.lower(dim_sparseness) == "bias":
-        df_degrade_data = create_bias_df(data_set, percentage=percentage_missing, seed=seed)
+    with stage("degrade", cells=data_set.size):
+        if str.lower(dim_sparseness) == "noise":
+            df_degrade_data = create_noise_df(data_set, percentage=percentage, rng=rng)
+        if str.lower(dim_sparseness) == "missing":
+            df_degrade_data = create_missing_value_df(data_set, percentage=percentage, rng=rng)
+        if str.lower(dim_sparseness) == "relevance":
+            df_degrade_data = create_relevance_df(data_set, percentage=percentage, seed=seed)
+        if str.lower(dim_sparseness) == "bias":
+            df_degrade_data = create_bias_df(data_set, percentage=percentage, rng=rng)
+
+    with stage("to_numeric", cells=df_degrade_data.size):
         df_degrade_data.iloc[:, 1:] = df_degrade_data.iloc[:, 1:].apply(pd.to_numeric)
 
-    nodes = []
-    for name, level in zip(names_nodes, levels_nodes):
-        node = Node(data_set, df_degrade_data, name, level)
-        nodes.append(node)
-        #print(node.name, "quality", node.quality, "quantity", node.quantity)
+    return df_degrade_data
 
-    #Determine weights
-    inventory_nodes = [node.average_inventory for node in nodes]
-    norm_weights = normalize(inventory_nodes)
 
-    scv_weight_inventory = sum([node.scv*weight for node, weight in zip(nodes, norm_weights)])
+def calculate_supply_chain_visibility(data_set, percentage_missing, names_nodes, levels_nodes, dim_sparseness="missing",
+                                      seed=2, cache_dir=None, estimator="monte_carlo", rng=None):
+    """ Data set and percentage of missing values to calculate supply chain visibility for.
+    The global measure for the level of visibility is the weighted average of the metrics assessed for each node.
+    The data set is either a data frame or a `GroundTruthProfile` that is reused over calls. When a cache directory
+    is given, the degraded data set is stored there and reused by later calls with the same parameters.
+    With the "analytical" estimator, the expected visibility over all seeds is calculated from the ground truth
+    instead (for missing values and noise, see `expected_scv.expected_supply_chain_visibility`).
+    The random draws come from the given Numpy Generator (or SeedSequence), or otherwise from a generator seeded with
+    the seed; no global random state is used. The cache is only used with a seed."""
+    if str.lower(estimator) == "analytical":
+        profile = data_set if isinstance(data_set, GroundTruthProfile) else GroundTruthProfile(data_set)
+        estimate = expected_supply_chain_visibility(profile, percentage_missing, names_nodes, dim_sparseness)
+
+        positions = [profile.columns.index(name) for name in names_nodes]
+        nodes = [NodeResult(*node) for node in zip(names_nodes, levels_nodes,
+                                                   estimate["expected_quantity_nodes"].tolist(),
+                                                   estimate["expected_quality_nodes"].tolist(),
+                                                   estimate["expected_scv_nodes"].tolist(),
+                                                   profile.average_inventory[positions].tolist())]
+        return estimate["expected_scv"], nodes
+
+    profile = data_set
+    if isinstance(data_set, GroundTruthProfile):
+        data_set = profile.frame
+
+    if cache_dir is None or rng is not None:
+        df_degrade_data = create_degraded_df(data_set, percentage_missing, dim_sparseness, seed=seed, rng=rng)
+    else:
+        source_key = profile.content_hash if isinstance(profile, GroundTruthProfile) else None
+        df_degrade_data = cached_degradation(partial(create_degraded_df, dim_sparseness=dim_sparseness), data_set,
+                                             dim_sparseness, percentage_missing, seed, cache_dir, source_key)
+
+    scv_weight_inventory, nodes = calculate_scv_degraded(profile, df_degrade_data, names_nodes, levels_nodes)
 
     #print("Global supply chain visibility is ", scv_weight_inventory, "%")
 
     return scv_weight_inventory, nodes
 
+def degrade_scenario_array(values, percentages_noise, percentages_missing, percentage_bias=0.25, rng=None,
+                           columns=None, bias_columns=None, percentage_noise_width=1):
+    """ Degrade a 2-D float array in place, in one pass: first bias on the rows, then noise and then missing values
+    with a user-defined percentage per node. The percentages refer to the given columns (by default the first
+    columns in order). All random draws come from one Numpy Generator, in the same order as `create_bias_df`,
+    `assign_noise` and `delete_values_completely_random` draw them, so the result equals degrading the data frame
+    step by step. As in `create_bias_df`, the last two columns are left out of the bias unless the bias columns are
+    given. """
+    rng = get_generator(rng)
+    rows = values.shape[0]
+    if columns is None:
+        columns = range(len(percentages_noise))
+    if bias_columns is None:
+        bias_columns = np.arange(values.shape[1])[:-2]
+
+    #First, Bias: rows are overwritten by a sample of rows following a LogNormal distribution
+    lognormal = rng.lognormal(size=rows)
+    rows_to_sample = round(rows*percentage_bias)
+    sample = rng.choice(rows, size=rows_to_sample, replace=True, p=lognormal/lognormal.sum())
+    replace = rng.choice(rows, size=rows_to_sample, replace=False)
+    values[np.ix_(replace, bias_columns)] = values[np.ix_(sample, bias_columns)]
+
+    #Second, Noise
+    for column, percentage in zip(columns, percentages_noise):
+        rows_noise = np.sort(rng.choice(rows, size=int(round(percentage*rows)), replace=False))
+        values[rows_noise, column] = noise_in_numbers(values[rows_noise, column], percentage_noise_width, rng)
+
+    #Third, Missing Values
+    for column, percentage in zip(columns, percentages_missing):
+        rows_missing = rng.choice(rows, size=int(round(percentage*rows)), replace=False)
+        values[rows_missing, column] = np.nan
+
+    return values
+
+def degrade_scenario(data_set, percentages_noise, percentages_missing, names_nodes, percentage_bias=0.25, rng=None):
+    """ Degrade a data set for a scenario: first bias on the data set, then noise and then missing values with a
+    user-defined percentage per node. All three dimensions are applied to one working array with one Numpy
+    Generator (see `degrade_scenario_array`). """
+    values = data_set.to_numpy(dtype=float, copy=True)
+    positions = [data_set.columns.get_loc(name) for name in names_nodes]
+    degrade_scenario_array(values, percentages_noise, percentages_missing, percentage_bias, rng, columns=positions)
+
+    return pd.DataFrame(values, index=data_set.index, columns=data_set.columns)
+
+def calculate_scv_scenario(data_set, percentages_noise, percentages_missing, names_nodes, levels_nodes,
+                           percentage_bias=0.25, rng=None):
+    """ Degrade a data set for a scenario and calculate its supply chain visibility straight from the working array,
+    without intermediate data frames. The data set is either a data frame or a `GroundTruthProfile`. """
+    profile = data_set if isinstance(data_set, GroundTruthProfile) else GroundTruthProfile(data_set)
+    positions = [profile.columns.index(name) for name in names_nodes]
+
+    values = profile.values.copy()
+    degrade_scenario_array(values, percentages_noise, percentages_missing, percentage_bias, rng, columns=positions)
+
+    return calculate_scv_arrays(profile.values[:, positions], values[:, positions], names_nodes, levels_nodes,
+                                profile.node_constants(names_nodes))
+
+def scenario_visibility(profile, percentages_noise, percentages_missing, names_nodes, percentage_bias=0.25,
+                        rng=None):
+    """ Degrade the ground truth of a profile for a scenario and return the quantity, quality and visibility per node
+    as arrays, the weight of each node and the global visibility, without creating a record per node. """
+    positions = [profile.columns.index(name) for name in names_nodes]
+
+    values = profile.values.copy()
+    degrade_scenario_array(values, percentages_noise, percentages_missing, percentage_bias, rng, columns=positions)
+
+    statistics = visibility_statistics(profile.values[:, positions], values[:, positions],
+                                       profile.node_constants(names_nodes))
+    quantity, quality, scv, average_inventory = finalize_visibility(statistics)
+
+    return quantity, quality, scv, average_inventory / np.sum(average_inventory), \
+        float(weight_visibility(scv, average_inventory))
+
+
+_sweep_state = {}
+
+def _sweep_profile(state):
+    """ Ground truth profile of a sweep task. Tasks that run in the current process (serially or in threads) get the
+    profile itself; tasks in worker processes get the descriptor of a `SharedGroundTruth` and attach to it once per
+    worker. """
+    if "profile" in state:
+        return state["profile"]
+
+    descriptor = state["descriptor"]
+    if _sweep_state.get("name") != descriptor["name"]:
+        if "shared" in _sweep_state:
+            _sweep_state["shared"].close()
+        shared = SharedGroundTruth.attach(descriptor)
+        _sweep_state.update(name=descriptor["name"], shared=shared, profile=shared.to_profile())
+
+    return _sweep_state["profile"]
+
+def _run_sweep_task(name_scenario, seed, state):
+    """ Degrade and score one scenario for one seed. The random stream only depends on the seed, so the result does
+    not depend on the worker that runs it. """
+    scenario = state["scenarios"][name_scenario]
+
+    rng = np.random.default_rng(seed)
+    return scenario_visibility(_sweep_profile(state), scenario["noise"], scenario["missing"], state["names_nodes"],
+                               percentage_bias=scenario.get("bias", 0.25), rng=rng)
+
+def map_tasks(function, tasks, executor="process", n_workers=None, chunksize=None):
+    """ Run a function for each tuple of arguments in the list of tasks and return the results in the same order.
+    The executor is "process" for a pool of processes, "thread" for a pool of threads, "serial" to run in the
+    current process or an `concurrent.futures.Executor` that is used as is. Threads avoid pickling and the start of
+    processes, which dominate when each task takes only a few milliseconds; the array operations of the scoring
+    release the GIL. """
+    if not tasks:
+        return []
+    if isinstance(executor, Executor):
+        return list(executor.map(function, *zip(*tasks), chunksize=chunksize or 1))
+    if str.lower(executor) == "serial":
+        return [function(*task) for task in tasks]
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, len(tasks) // (4 * n_workers))
+    with open_executor(executor, n_workers) as pool:
+        return list(pool.map(function, *zip(*tasks), chunksize=chunksize))
+
+def open_executor(executor="process", n_workers=None):
+    """ Context manager with the pool of an executor of `map_tasks`, to share one pool between several calls. An
+    `Executor` and "serial" are returned as is. """
+    if isinstance(executor, Executor) or str.lower(executor) == "serial":
+        return nullcontext(executor)
+
+    executors = {"process": ProcessPoolExecutor, "thread": ThreadPoolExecutor}
+    if str.lower(executor) not in executors:
+        raise ValueError("Unknown executor {0}".format(executor))
+    return executors[str.lower(executor)](max_workers=n_workers or os.cpu_count() or 1)
+
+def _sweep_arguments(shared, executor, **arguments):
+    """ Arguments shared by all tasks of a sweep: the profile for tasks in the current process, otherwise the
+    descriptor of the shared ground truth. """
+    in_process = isinstance(executor, ThreadPoolExecutor) or \
+        (isinstance(executor, str) and str.lower(executor) in ("serial", "thread"))
+    if in_process:
+        return dict(arguments, profile=shared.to_profile())
+    return dict(arguments, descriptor=shared.descriptor)
+
+def _run_adaptive_sweep(function, result, target_half_width, confidence, batch_size, converge_nodes, executor,
+                        n_workers, chunksize):
+    """ Run the seeds of the scenarios of a `SweepResult` in batches until the confidence interval of the mean global
+    visibility of a scenario (and, with converge_nodes, of the visibility of each node) has at most the target
+    half-width, or until all seeds of the result are run. Every scenario stops on its own. """
+    n_scenarios, max_seeds = result.global_scv.shape
+    statistics = [RunningStatistics() for _ in range(n_scenarios)]
+    statistics_nodes = [RunningStatistics(len(result.names_nodes)) for _ in range(n_scenarios)]
+    done = np.zeros(n_scenarios, dtype=int)
+    result.converged = np.zeros(n_scenarios, dtype=bool)
+
+    active = list(range(n_scenarios))
+    with open_executor(executor, n_workers) as pool:
+        while active:
+            positions = [(scenario, position) for scenario in active
+                         for position in range(done[scenario], min(done[scenario] + batch_size, max_seeds))]
+            tasks = [(result.scenarios[scenario], result.seeds[position]) for scenario, position in positions]
+            outcomes = map_tasks(function, tasks, pool, chunksize=chunksize or
+                                 max(1, len(tasks) // (4 * (n_workers or os.cpu_count() or 1))))
+            for (scenario, position), outcome in zip(positions, outcomes):
+                result.set(scenario, position, *outcome)
+
+            for scenario in list(active):
+                batch = slice(done[scenario], min(done[scenario] + batch_size, max_seeds))
+                statistics[scenario].update(result.global_scv[scenario, batch])
+                statistics_nodes[scenario].update(result.nodes["scv"][scenario, batch])
+                done[scenario] = batch.stop
+
+                with np.errstate(invalid="ignore"):
+                    converged = statistics[scenario].half_width(confidence) <= target_half_width
+                    if converge_nodes:
+                        converged &= np.all(statistics_nodes[scenario].half_width(confidence) <= target_half_width)
+                result.converged[scenario] = converged
+                if converged or done[scenario] == max_seeds:
+                    active.remove(scenario)
+
+    result.half_width = np.array([running.half_width(confidence) for running in statistics])
+    result.half_width_nodes = np.array([running.half_width(confidence) for running in statistics_nodes])
+
+def run_scenario_sweep(data_set, scenarios, names_nodes, levels_nodes, seeds=range(1, 201), n_workers=None,
+                       chunksize=None, executor="process", target_half_width=None, confidence=0.95, batch_size=20,
+                       converge_nodes=False):
+    """ Calculate the supply chain visibility of each scenario for each seed, spread over a pool of workers.
+    Scenarios is a dictionary with the name of the scenario as key and a dictionary with the percentage of noise
+    ("noise") and of missing values ("missing") per node and the percentage of bias ("bias", default 0.25) as value.
+    Each seed has its own Numpy Generator, so the results are identical for any executor and number of workers
+    (see `map_tasks`); with one worker the sweep runs in the current process. Worker processes read the data set
+    from a `SharedGroundTruth` instead of a copy. The data set is either a data frame or a `GroundTruthProfile`.
+
+    With a target half-width, e.g. 0.1 for a 95% confidence interval of +/- 0.1 SCV points, the seeds run in batches
+    of batch_size and each scenario stops once the confidence interval of its mean global visibility (and, with
+    converge_nodes, of the mean visibility of every node) is narrow enough; seeds is then the maximum. A scenario
+    runs the first seeds in order, so its results equal those of a sweep over all seeds.
+
+    Returns a `SweepResult` with the quantity, quality, visibility and weight per scenario, seed and node and the
+    global visibility per scenario and seed; seeds that were not run are NaN. """
+    seeds = list(seeds)
+    if n_workers == 1:
+        executor = "serial"
+
+    result = SweepResult(scenarios, seeds, names_nodes, levels_nodes)
+    with SharedGroundTruth.create(data_set) as shared:
+        state = _sweep_arguments(shared, executor, scenarios=scenarios, names_nodes=list(names_nodes))
+        function = partial(_run_sweep_task, state=state)
+
+        if target_half_width is None:
+            tasks = [(name, seed) for name in scenarios for seed in seeds]
+            for index, outcome in enumerate(map_tasks(function, tasks, executor, n_workers, chunksize)):
+                result.set(index // len(seeds), index % len(seeds), *outcome)
+        else:
+            _run_adaptive_sweep(function, result, target_half_width, confidence, batch_size, converge_nodes,
+                                executor, n_workers, chunksize)
+        state.clear()
+
+        positions = [shared.columns.index(name) for name in names_nodes]
+        result.average_inventory = (shared.inventory_sum / shared.full_count)[positions]
+
+    return result
+
+def _score_degraded_task(data_set, state):
+    """ Score one degraded data set against the ground truth of the task state. """
+    return calculate_scv_degraded(_sweep_profile(state), data_set, state["names_nodes"], state["levels_nodes"])
+
+def score_degraded_datasets(data_set, degraded_data_sets, names_nodes, levels_nodes, executor="thread",
+                            n_workers=None, chunksize=None):
+    """ Calculate the supply chain visibility of many degraded data sets against one ground truth, spread over a pool
+    of workers (see `map_tasks`). By default threads are used: they share the ground truth and the degraded data
+    sets without pickling them. The data set is either a data frame or a `GroundTruthProfile`.
+
+    Returns a list with the global visibility and the nodes of each degraded data set. """
+    with SharedGroundTruth.create(data_set) as shared:
+        state = _sweep_arguments(shared, executor, names_nodes=list(names_nodes), levels_nodes=list(levels_nodes))
+        outcomes = map_tasks(partial(_score_degraded_task, state=state), [(degraded, ) for degraded in
+                                                                          degraded_data_sets],
+                             executor, n_workers, chunksize)
+        state.clear()
+
+    return outcomes
+
+def degrade_grid_array(values, dim_sparseness, percentages, rng=None, columns=None, percentage_noise_width=1):
+    """ Degrade a 2-D float array on one dimension of data sparseness for several percentages at once, with nested
+    degradations: every percentage uses the first cells (or rows, for bias) of one random order per call, so the
+    cells degraded at a lower percentage are also degraded at every higher percentage, in the same way. Each
+    percentage on its own has the same distribution as `create_missing_value_df`, `create_noise_df` and
+    `create_bias_df`: missing values and noise select cells over the given columns (by default all but the last
+    two), bias overwrites rows of those columns with a sample of rows following a LogNormal distribution.
+
+    Returns a 3-D array with the degraded array per percentage. """
+    rng = get_generator(rng)
+    rows = values.shape[0]
+    if columns is None:
+        columns = np.arange(values.shape[1])[:-2]
+    columns = np.asarray(columns)
+
+    degraded = np.repeat(values[np.newaxis], len(percentages), axis=0)
+    if str.lower(dim_sparseness) == "bias":
+        counts = [round(rows*percentage) for percentage in percentages]
+        lognormal = rng.lognormal(size=rows)
+        sample = rng.choice(rows, size=max(counts, default=0), replace=True, p=lognormal/lognormal.sum())
+        replace = rng.permutation(rows)
+        for degraded_values, count in zip(degraded, counts):
+            degraded_values[np.ix_(replace[:count], columns)] = values[np.ix_(sample[:count], columns)]
+        return degraded
+
+    size = rows*len(columns)
+    counts = [int(round(percentage*size)) for percentage in percentages]
+    cells = rng.permutation(size)
+    if str.lower(dim_sparseness) == "noise":
+        standard_normal = rng.standard_normal(max(counts, default=0))
+
+    for degraded_values, count in zip(degraded, counts):
+        cell_rows, cell_columns = np.divmod(cells[:count], len(columns))
+        cell_columns = columns[cell_columns]
+        if str.lower(dim_sparseness) == "missing":
+            degraded_values[cell_rows, cell_columns] = np.nan
+        elif str.lower(dim_sparseness) == "noise":
+            degraded_values[cell_rows, cell_columns] = shift_numbers(values[cell_rows, cell_columns],
+                                                                     percentage_noise_width, standard_normal[:count])
+        else:
+            raise ValueError("No grid degradation for the dimension {0}".format(dim_sparseness))
+
+    return degraded
+
+def _run_grid_task(dimension, seed, state):
+    """ Degrade and score all percentages of one dimension for one seed. Returns the quantity, quality and
+    visibility per percentage and node and the global visibility per percentage. """
+    profile = _sweep_profile(state)
+    names_nodes = state["names_nodes"]
+    positions = [profile.columns.index(name) for name in names_nodes]
+
+    degraded = degrade_grid_array(profile.values, dimension, state["percentages"][dimension],
+                                  np.random.default_rng(seed), percentage_noise_width=state["percentage_noise_width"])
+    statistics = visibility_statistics(profile.values[:, positions], degraded[:, :, positions],
+                                       profile.node_constants(names_nodes))
+    quantity, quality, scv, average_inventory = finalize_visibility(statistics)
+
+    return quantity, quality, scv, weight_visibility(scv, average_inventory)
+
+def run_grid_sweep(data_set, dimensions, percentages, names_nodes, levels_nodes, seeds=range(1, 201),
+                   percentage_noise_width=1, executor="serial", n_workers=None, chunksize=None):
+    """ Calculate the supply chain visibility for every dimension of data sparseness, percentage and seed, as in the
+    analysis of the individual dimensions, but degrading all percentages of a dimension and seed at once with nested
+    degradations (see `degrade_grid_array`). The ground truth profile is built once and each dimension and seed has
+    its own Numpy Generator, so the results are identical for any executor (see `map_tasks`). Nested degradations
+    make the curves over the percentages smoother, so fewer seeds are needed for the same confidence. Percentages is
+    a list for all dimensions or a dictionary with a list per dimension. The data set is either a data frame or a
+    `GroundTruthProfile`.
+
+    Returns a data frame with a row per dimension, percentage, seed and node with the quantity, quality and
+    visibility of the node, and a row with node "global" with the global visibility. """
+    if not isinstance(percentages, dict):
+        percentages = {dimension: percentages for dimension in dimensions}
+    tasks = [(dimension, seed) for dimension in dimensions for seed in seeds]
+
+    with SharedGroundTruth.create(data_set) as shared:
+        state = _sweep_arguments(shared, executor, percentages=percentages, names_nodes=list(names_nodes),
+                                 percentage_noise_width=percentage_noise_width)
+        outcomes = map_tasks(partial(_run_grid_task, state=state), tasks, executor, n_workers, chunksize)
+        state.clear()
+
+    records = []
+    for (dimension, seed), (quantity, quality, scv, global_scv) in zip(tasks, outcomes):
+        for index, percentage in enumerate(percentages[dimension]):
+            records.extend(zip([dimension]*len(names_nodes), [percentage]*len(names_nodes), [seed]*len(names_nodes),
+                               names_nodes, levels_nodes, quantity[index], quality[index], scv[index]))
+            records.append((dimension, percentage, seed, "global", np.nan, np.nan, np.nan, global_scv[index]))
+
+    return pd.DataFrame.from_records(records, columns=["dimension", "percentage", "seed", "node", "level",
+                                                       "quantity", "quality", "scv"])
+
+def _choose_rows(rng, shape, counts):
+    """ Boolean mask of the given shape with, for every column of every leading index, exactly counts[column] rows
+    chosen without replacement (the rows with the lowest random keys). """
+    ranks = rng.random(shape).argsort(axis=-2).argsort(axis=-2)
+    return ranks < np.asarray(counts)
+
+def degrade_scenario_batch(values, percentages_noise, percentages_missing, percentage_bias=0.25, rng=None,
+                           columns=None, bias_columns=None, percentage_noise_width=1):
+    """ Degrade a stack of arrays shaped (..., time step, column) for a scenario, all at once: first bias on the rows,
+    then noise and then missing values with a user-defined percentage per node, with the same distributions as
+    `degrade_scenario_array` for each array of the stack (but other random draws). The percentages refer to the given
+    columns (by default the first columns in order); the bias applies to the bias columns, by default all columns,
+    as the stack only holds the actors. Returns a new array. """
+    rng = get_generator(rng)
+    values = np.asarray(values, dtype=float)
+    leading, rows = values.shape[:-2], values.shape[-2]
+    if columns is None:
+        columns = np.arange(len(percentages_noise))
+    if bias_columns is None:
+        bias_columns = np.arange(values.shape[-1])
+    degraded = values.copy()
+
+    #First, Bias: rows are overwritten by a sample of rows following a LogNormal distribution
+    rows_to_sample = round(rows*percentage_bias)
+    if rows_to_sample > 0:
+        lognormal = rng.lognormal(size=leading + (rows,)).reshape(-1, rows)
+        cumulative = np.cumsum(lognormal, axis=-1)
+        cumulative /= cumulative[:, -1:]
+        offset = np.arange(len(cumulative))[:, np.newaxis]
+        uniform = rng.random((len(cumulative), rows_to_sample))
+        sample = np.searchsorted((cumulative + offset).ravel(), (uniform + offset).ravel()).reshape(uniform.shape)
+        sample = np.minimum(sample - offset*rows, rows - 1).reshape(leading + (rows_to_sample, 1))
+        replace = rng.random(leading + (rows,)).argsort(axis=-1)[..., :rows_to_sample, np.newaxis]
+
+        biased = degraded[..., bias_columns]
+        np.put_along_axis(biased, replace, np.take_along_axis(values[..., bias_columns], sample, axis=-2), axis=-2)
+        degraded[..., bias_columns] = biased
+
+    #Second, Noise
+    shape = leading + (rows, len(columns))
+    node_values = degraded[..., columns]
+    noise = _choose_rows(rng, shape, [int(round(percentage*rows)) for percentage in percentages_noise])
+    node_values = np.where(noise, shift_numbers(node_values, percentage_noise_width, rng.standard_normal(shape)),
+                           node_values)
+
+    #Third, Missing Values
+    missing = _choose_rows(rng, shape, [int(round(percentage*rows)) for percentage in percentages_missing])
+    node_values[missing] = np.nan
+    degraded[..., columns] = node_values
+
+    return degraded
+
+def calculate_scv_batch(ground_truths, degraded=None, scenario=None, n_seeds=200, seed=0, chunk_size=16,
+                        columns=None):
+    """ Calculate the supply chain visibility of a stack of ground truths shaped (configuration, replication, time
+    step, actor), e.g. from `ground_truth.stack_replications`, in vectorized chunks of ground truths. The degraded
+    counterparts are either given, shaped (configuration, replication, seed, time step, actor), or generated per
+    chunk for a scenario: a dictionary with the percentage of noise ("noise") and of missing values ("missing") per
+    node and the percentage of bias ("bias", default 0.25). Generated degradations of a ground truth draw n_seeds
+    degraded data sets at once from their own random stream, derived from the seed and the position of the ground
+    truth, so the degraded data sets do not depend on the chunk size. The global visibility weighs the nodes (by default all
+    actors) by their average inventory in each ground truth.
+
+    Returns the global visibility shaped (configuration, replication, seed). """
+    ground_truths = np.asarray(ground_truths, dtype=float)
+    configurations, replications = ground_truths.shape[:2]
+    if columns is None:
+        columns = np.arange(ground_truths.shape[-1])
+    flat = ground_truths.reshape((configurations*replications,) + ground_truths.shape[2:])
+    if degraded is not None:
+        degraded = np.asarray(degraded, dtype=float)
+        degraded = degraded.reshape((configurations*replications,) + degraded.shape[2:])
+        n_seeds = degraded.shape[1]
+
+    global_scv = np.empty((len(flat), n_seeds))
+    for start in range(0, len(flat), chunk_size):
+        full_values = flat[start:start + chunk_size]
+        if degraded is not None:
+            degraded_values = degraded[start:start + chunk_size]
+        else:
+            degraded_values = np.stack([
+                degrade_scenario_batch(np.broadcast_to(truth, (n_seeds,) + truth.shape), scenario["noise"],
+                                       scenario["missing"], scenario.get("bias", 0.25),
+                                       np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(position,))),
+                                       columns=columns)
+                for position, truth in enumerate(full_values, start)])
+
+        statistics = visibility_statistics(full_values[:, np.newaxis][..., columns], degraded_values[..., columns])
+        quantity, quality, scv, average_inventory = finalize_visibility(statistics)
+        global_scv[start:start + chunk_size] = weight_visibility(scv, average_inventory)
+
+    return global_scv.reshape(configurations, replications, n_seeds)
+
 def determine_weight_levels(levels):
     """ Levels is a list with the level of which the actors in the supply chain is.
     The closer the location, the more weight is assigned."""
@@ -1,26 +1,81 @@
-import random
 import numpy as np
 import pandas as pd
 
 from degrade_data.restructure_data import read_and_shape_data, combine_lat_lon
+from degrade_data.sampling import get_generator
+from degrade_data.instrumentation import stage
 
-def sample_bias(dataframe, bias_percentage):
+def sample_bias(dataframe, bias_percentage, rng=None):
     """This functions draws an user-defined biased sample from the dataset and combines this with the normal dataset.
-    The distribution used for this biased sample set is a LogNormal distribution."""
+    The distribution used for this biased sample set is a LogNormal distribution. All draws come from the given Numpy
+    Generator (or seed, see `get_generator`)."""
+    rng = get_generator(rng)
+
+    with stage("sample_bias", cells=dataframe.size):
+        lognormal = rng.lognormal(size=len(dataframe))
+        rows_to_sample = round(len(dataframe)*bias_percentage)
+        sample = rng.choice(len(dataframe), size=rows_to_sample, replace=True, p=lognormal/lognormal.sum())
+
+        replace = rng.choice(len(dataframe), size=rows_to_sample, replace=False)
+        df = dataframe.copy()
+        df.iloc[replace] = dataframe.iloc[sample].values
+        df = df.reset_index(drop=True)
+    return df
 
-    lognormal = np.random.lognormal(size=len(dataframe))
-    rows_to_sample = round(len(dataframe)*bias_percentage)
-    sample = dataframe.sample(rows_to_sample, weights=lognormal, replace=True)
 
-    replace = dataframe.sample(sample.shape[0])
-    df = dataframe.copy()
-    df.loc[replace.index] = sample.values
-    df = df.reset_index(drop=True)
-    return df
 
+def determine_bias(values, bias_percentage, highest_count, rng, remove=False):
+    """ This function is the shared engine of the bias functions. It counts the attributes of a column once, chooses
+    the attribute that represents the bias and samples the rows that have to change to (or, when remove is True,
+    have to be removed for) that attribute. When the attribute already occurs too often, the attribute with the next
+    highest count is taken, in one pass over the attributes sorted by count.
+
+    Parameters:
+        values          : Numpy array with the values of the column.
+        bias_percentage : Percentage of bias in the column.
+        highest_count   : Determine whether the attribute with the highest count
+                          represent the bias or a randomly chosen attribute.
+        rng             : Numpy Generator.
+        remove (bool)   : Determine the rows to remove instead of the rows to change.
+
+    Returns:
+        attribute_bias  : Attribute that represents the bias.
+        rows            : Numpy array with the positions of the rows to change or remove. """
+
+    codes, attributes = pd.factorize(values)
+    counts = np.bincount(codes[codes >= 0], minlength=len(attributes))
+
+    if highest_count:
+        code_bias = int(np.argmax(counts))
+    else:
+        code_bias = int(rng.integers(len(attributes)))
 
+    if remove:
+        number_of_rows = lambda count: int(len(values) - round(count / bias_percentage))
+    else:
+        total_rows_bias = round(int(len(values)) * bias_percentage)
+        number_of_rows = lambda count: total_rows_bias - count
+
+    rows_to_change = number_of_rows(counts[code_bias])
+    if rows_to_change < 0:
+        #Attributes from the second highest count downwards, the first one that fits represents the bias
+        order = np.argsort(-counts, kind="stable")[1:]
+        fits = [code for code in order if number_of_rows(counts[code]) >= 0]
+        if fits:
+            code_bias = int(fits[0])
+            rows_to_change = number_of_rows(counts[code_bias])
+        else:
+            if len(order) > 0:
+                code_bias = int(order[-1])
+            rows_to_change = 0
 
-def assign_bias(dataframe, bias_percentage, highest_count, **kwargs):
+    # Sample the index of rows to change
+    index_to_choose = np.flatnonzero(codes != code_bias)
+    rows = rng.choice(index_to_choose, size=rows_to_change, replace=False)
+
+    return attributes[code_bias], rows
+
+def assign_bias(dataframe, bias_percentage, highest_count, rng=None, **kwargs):
     """ This function assigns an user-defined percentage of bias to a dataframe. The percentage bias in each
      column is calculated by the bias percentage divided by the number of data fields. When the highest
      count is True, the attribute with the highest count in a column represents an user-defined percentage of values
@@ -32,47 +87,28 @@ def assign_bias(dataframe, bias_percentage, highest_count, **kwargs):
         bias_percentage : Percentage of bias
         highest_count   : Determine whether the attribute with the highest count
                           represent the bias or a randomly chosen attribute. Default is True.
+        rng             : Numpy Generator.
         **kwargs        :
 
     Returns:
         bias_df      : Dataframe with bias given the column and percentage. """
 
-    bias_percentage_column = bias_percentage/len(dataframe.columns)
-    for column_name in dataframe.columns:
+    rng = get_generator(rng)
+    with stage("assign_bias", cells=dataframe.size):
+        bias_percentage_column = bias_percentage/len(dataframe.columns)
+        for column_name in dataframe.columns:
+            values = dataframe[column_name].to_numpy(copy=True)
+            attribute_bias, rows = determine_bias(values, bias_percentage_column, highest_count, rng)
 
-        dict_count = {value: dataframe[column_name].value_counts()[value] for value in \
-                      dataframe[column_name].value_counts().index.tolist()}
+            values[rows] = attribute_bias
+            dataframe[column_name] = values
 
-        if highest_count:
-            attribute_bias = max(dict_count, key=dict_count.get)
-
-        else:
-            attribute_bias = random.sample(dict_count.keys(), k=1)[0]
-
-        total_rows_bias = round(int(len(dataframe)) * bias_percentage_column)
-        rows_to_change = total_rows_bias - dict_count[attribute_bias]
-        n = -2
-        while rows_to_change < 0:
-            try:
-                attribute_bias = sorted(dict_count.items(), key=(lambda i: i[1]))[n][0]
-                rows_to_change = total_rows_bias - dict_count[attribute_bias]
-                n -= 1
-            except IndexError:
-                rows_to_change = 0
-
-        # Sample the index of rows to remove
-        index_to_choose = dataframe.index[dataframe[column_name] != attribute_bias].tolist()
-        sampling = random.sample(index_to_choose, k=rows_to_change)
-
-        for i in sampling:
-            dataframe[column_name][i] = attribute_bias
-
-        # print("Added bias to percentage {0:.3f} of the {1} values on {2} "
-        #       "(highest count {3})".format(bias_percentage_column, column_name, attribute_bias, highest_count))
+            # print("Added bias to percentage {0:.3f} of the {1} values on {2} "
+            #       "(highest count {3})".format(bias_percentage_column, column_name, attribute_bias, highest_count))
 
     return dataframe
 
-def assign_bias_change_one_column(dataframe, bias_percentage, highest_count, **kwargs):
+def assign_bias_change_one_column(dataframe, bias_percentage, highest_count, rng=None, **kwargs):
     """ This function assigns an user-defined percentage of bias to a column. When the highest
      count is True, the attribute with the highest count in a column represents an user-defined percentage of values
      in the dataframe. When highest count is False, the attribute that represents bias is randomly chosen by
@@ -85,41 +121,23 @@ def assign_bias_change_one_column(dataframe, bias_percentage, highest_count, **k
         bias_percentage : Percentage of bias
         highest_count   : Determine whether the attribute with the highest count
                           represent the bias or a randomly chosen attribute. Default is True.
+        rng             : Numpy Generator.
         **kwargs        :
 
     Returns:
         bias_df      : Dataframe with bias given the column and percentage. """
 
-    column_name = random.sample(set(dataframe.columns), k=1)[0]
+    rng = get_generator(rng)
+    column_name = dataframe.columns[rng.integers(len(dataframe.columns))]
     if "column_name" in kwargs:
         column_name = kwargs["column_name"]
 
-    dict_count = {value: dataframe[column_name].value_counts()[value] for value in \
-                  dataframe[column_name].value_counts().index.tolist()}
-
-    if highest_count:
-        attribute_bias = max(dict_count, key=dict_count.get)
-
-    else:
-        attribute_bias = random.sample(dict_count.keys(), k=1)[0]
-
-    total_rows_bias = round(int(len(dataframe)) * bias_percentage)
-    rows_to_change = total_rows_bias - dict_count[attribute_bias]
-    n = -2
-    while rows_to_change < 0:
-        try:
-            attribute_bias = sorted(dict_count.items(), key=(lambda i: i[1]))[n][0]
-            rows_to_change = total_rows_bias - dict_count[attribute_bias]
-            n -= 1
-        except IndexError:
-            rows_to_change = 0
+    with stage("assign_bias_change_one_column", cells=len(dataframe)):
+        values = dataframe[column_name].to_numpy(copy=True)
+        attribute_bias, rows = determine_bias(values, bias_percentage, highest_count, rng)
 
-    # Sample the index of rows to remove
-    index_to_choose = dataframe.index[dataframe[column_name] != attribute_bias].tolist()
-    sampling = random.sample(index_to_choose, k=rows_to_change)
-
-    for i in sampling:
-        dataframe[column_name][i] = attribute_bias
+        values[rows] = attribute_bias
+        dataframe[column_name] = values
 
     print("Added bias to percentage {0:.2f} of the {1} values on {2} "
           "(highest count {3})".format(bias_percentage, column_name, attribute_bias, highest_count))
@@ -127,7 +145,7 @@ def assign_bias_change_one_column(dataframe, bias_percentage, highest_count, **k
     return dataframe
 
 
-def assign_bias_remove(dataframe, bias_percentage, highest_count, **kwargs):
+def assign_bias_remove(dataframe, bias_percentage, highest_count, rng=None, **kwargs):
     """ This function assigns an user-defined percentage of bias to an user-defined column.  When the highest
      count is True, the attribute with the highest count in a column represents an user-defined percentage of values
      in the dataframe. When highest count is False, the attribute that represents bias is randomly chosen by
@@ -140,42 +158,24 @@ def assign_bias_remove(dataframe, bias_percentage, highest_count, **kwargs):
         bias_percentage : Percentage of bias
         highest_count   : Determine whether the attribute with the highest count
                           represent the bias or a randomly chosen attribute. Default is True.
+        rng             : Numpy Generator.
         **kwargs        :
 
     Returns:
         bias_df      : Dataframe with bias given the column and percentage. """
 
-    column_name = random.sample(set(dataframe.columns), k=1)[0]
+    rng = get_generator(rng)
+    column_name = dataframe.columns[rng.integers(len(dataframe.columns))]
     if "column_name" in kwargs:
         column_name = kwargs["column_name"]
 
-    dict_count = {value: dataframe[column_name].value_counts()[value] for value in \
-                  dataframe[column_name].value_counts().index.tolist()}
-
-    if highest_count:
-        attribute_bias = max(dict_count, key=dict_count.get)
-
-    else:
-        attribute_bias = random.sample(dict_count.keys(), k=1)[0]
-
-    rows_to_remove = int(len(dataframe) - round(dict_count[attribute_bias] / bias_percentage))
-    n = -2
-    while rows_to_remove < 0:
-        try:
-            attribute_bias = sorted(dict_count.items(), key=(lambda i: i[1]))[n][0]
-            rows_to_remove = int(len(dataframe) - round(dict_count[attribute_bias] / bias_percentage))
-            n -= 1
-        except IndexError:
-            rows_to_remove = 0
+    with stage("assign_bias_remove", cells=dataframe.size):
+        attribute_bias, rows = determine_bias(dataframe[column_name].to_numpy(), bias_percentage, highest_count, rng,
+                                              remove=True)
 
-    # Sample the index of rows to remove
-    index_to_choose = dataframe.index[dataframe[column_name] != attribute_bias].tolist()
-    sampling = random.sample(index_to_choose, k=rows_to_remove)
-
-    bias_df = dataframe.drop(dataframe.index[sampling], axis=0)
+        bias_df = dataframe.drop(dataframe.index[rows], axis=0)
 
     print("Added bias to percentage {0:.2f} of the {1} values on {2} "
           "(highest count {3})".format(bias_percentage, column_name, attribute_bias, highest_count))
 
     return bias_df
-
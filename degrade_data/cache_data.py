@@ -0,0 +1,168 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+
+from degrade_data.restructure_data import read_and_shape_data
+from ground_truth import hash_ground_truth
+
+try:
+    import pyarrow
+    import pyarrow.feather
+except ImportError:
+    pyarrow = None
+
+INDEX_COLUMN = "__index__"
+
+def file_key(file_name):
+    """This function determines the key of a source file from its modification time, size and content hash.
+
+    Parameters:
+        file_name (str)     : Name of the file.
+
+    Returns:
+        key (str)           : Key of the file."""
+    digest = hashlib.sha256()
+    with open(file_name, "rb") as source:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+
+    status = os.stat(file_name)
+    return "{0}:{1}:{2}".format(status.st_mtime_ns, status.st_size, digest.hexdigest())
+
+def frame_key(dataframe):
+    """This function determines the key of a dataframe from the hash of its values, index and column names, the same
+    content hash as a `GroundTruthProfile` uses.
+
+    Parameters:
+        dataframe           : Dataframe.
+
+    Returns:
+        key (str)           : Key of the dataframe."""
+    return hash_ground_truth(dataframe)
+
+def cache_path(cache_dir, *key_parts):
+    """This function determines the path in the cache directory for the given parts of a key."""
+    key = hashlib.sha256(repr(key_parts).encode()).hexdigest()
+    return os.path.join(cache_dir, key)
+
+def save_frame(dataframe, path):
+    """This function stores a dataframe in a columnar binary format: Feather when pyarrow is installed, otherwise
+    one .npy file per column. The index and the column names are kept in a json file next to it.
+
+    Parameters:
+        dataframe           : Dataframe to store.
+        path (str)          : Path without extension."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    metadata = {"columns": [str(name) for name in dataframe.columns],
+                "index_name": dataframe.index.name}
+
+    if pyarrow is not None:
+        metadata["format"] = "feather"
+        stored = dataframe.copy()
+        stored.columns = metadata["columns"]
+        stored.insert(0, INDEX_COLUMN, dataframe.index)
+        stored.reset_index(drop=True).to_feather(path + ".feather.tmp")
+        os.replace(path + ".feather.tmp", path + ".feather")
+    else:
+        metadata["format"] = "npy"
+        directory = path + ".npy.tmp"
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "index.npy"), dataframe.index.to_numpy(), allow_pickle=True)
+        for position in range(dataframe.shape[1]):
+            np.save(os.path.join(directory, "{0}.npy".format(position)), dataframe.iloc[:, position].to_numpy(),
+                    allow_pickle=True)
+        shutil.rmtree(path + ".npy", ignore_errors=True)
+        os.replace(directory, path + ".npy")
+
+    with open(path + ".json", "w") as metadata_file:
+        json.dump(metadata, metadata_file)
+
+def load_frame(path):
+    """This function loads a dataframe that was stored with `save_frame`, memory-mapping the columns. It returns
+    None when the dataframe is not in the cache.
+
+    Parameters:
+        path (str)          : Path without extension.
+
+    Returns:
+        dataframe           : Dataframe or None."""
+    if not os.path.exists(path + ".json"):
+        return None
+
+    with open(path + ".json") as metadata_file:
+        metadata = json.load(metadata_file)
+
+    if metadata["format"] == "feather":
+        if pyarrow is None or not os.path.exists(path + ".feather"):
+            return None
+        table = pyarrow.feather.read_table(path + ".feather", memory_map=True)
+        dataframe = table.to_pandas().set_index(INDEX_COLUMN)
+    else:
+        directory = path + ".npy"
+        if not os.path.exists(directory):
+            return None
+        columns = {position: load_array(os.path.join(directory, "{0}.npy".format(position)))
+                   for position in range(len(metadata["columns"]))}
+        dataframe = pd.DataFrame(columns, index=load_array(os.path.join(directory, "index.npy")))
+
+    dataframe.index.name = metadata["index_name"]
+    dataframe.columns = metadata["columns"]
+
+    return dataframe
+
+def load_array(file_name):
+    """Numerical arrays are memory-mapped; arrays of objects are loaded in memory."""
+    try:
+        return np.load(file_name, mmap_mode="r")
+    except ValueError:
+        return np.load(file_name, allow_pickle=True)
+
+def cached_read_and_shape_data(file_name, cache_dir, typed=False):
+    """This function reads and reshapes the Excel file from the Simio simulation model with `read_and_shape_data`,
+    unless the shaped data of the same file (same modification time and hash) is in the cache.
+
+    Parameters:
+        file_name (str)     : Name of excel input file of type ".xlsx" (without extension) or of a ".csv" file.
+        cache_dir (str)     : Directory of the cache.
+        typed (bool)        : Keep Date and Time as datetime64 and timedelta64 (see `read_and_shape_data`).
+
+    Returns:
+        observed_data       : Dataframe from reshaped excel input file."""
+    source = file_name if file_name.lower().endswith(".csv") else file_name + ".xlsx"
+    path = cache_path(cache_dir, "shaped", file_key(source), typed)
+
+    observed_data = load_frame(path)
+    if observed_data is None:
+        observed_data = read_and_shape_data(file_name, typed=typed)
+        save_frame(observed_data, path)
+
+    return observed_data
+
+def cached_degradation(degrade, dataframe, dimension, percentage, seed, cache_dir, source_key=None):
+    """This function degrades a dataframe with the given function, unless a dataframe degraded from the same source
+    with the same dimension, percentage and seed is in the cache.
+
+    Parameters:
+        degrade             : Function that degrades the dataframe, called as degrade(dataframe, percentage, seed=seed).
+        dataframe           : Dataframe to degrade.
+        dimension (str)     : Dimension of data sparseness.
+        percentage          : Percentage (or list of percentages) of degradation.
+        seed (int)          : Seed of the degradation.
+        cache_dir (str)     : Directory of the cache.
+        source_key (str)    : Key of the source of the dataframe. Default is the hash of the dataframe.
+
+    Returns:
+        degraded_df         : Degraded dataframe."""
+    if source_key is None:
+        source_key = frame_key(dataframe)
+    path = cache_path(cache_dir, "degraded", source_key, str.lower(dimension), repr(percentage), seed)
+
+    degraded_df = load_frame(path)
+    if degraded_df is None:
+        degraded_df = degrade(dataframe, percentage, seed=seed)
+        save_frame(degraded_df, path)
+
+    return degraded_df
@@ -0,0 +1,145 @@
+import json
+import time
+import cProfile
+import pstats
+import tracemalloc
+import contextvars
+
+_recorder = contextvars.ContextVar("scv_recorder", default=None)
+
+
+class Recorder(object):
+    """Opt-in instrumentation of the hot paths. Within `with Recorder() as recorder:` every stage of the
+    degradation functions and of `calculate_supply_chain_visibility` records its wall time, number of calls, number
+    of cells processed and, when memory is traced, the peak of the memory allocated by the stage. The recorder is
+    stored in a context variable, so concurrent sweeps in other threads or tasks are not recorded.
+
+    Parameters:
+        callbacks (lst)         : Functions called after every stage as callback(name, seconds, cells, allocated).
+        profile (bool)          : Also run cProfile while recording; the statistics are in `profile_stats`.
+        trace_memory (bool)     : Trace the allocations with tracemalloc; the snapshot at the end is in
+                                  `memory_snapshot`. Tracing slows the code down considerably, and the peak of
+                                  a stage only covers the part after its last nested stage."""
+
+    def __init__(self, callbacks=None, profile=False, trace_memory=False):
+        self.callbacks = list(callbacks or [])
+        self.profile = profile
+        self.trace_memory = trace_memory
+
+        self.stages = {}
+        self.profile_stats = None
+        self.memory_snapshot = None
+
+        self._profiler = None
+        self._token = None
+        self._started_tracing = False
+
+    def record(self, name, seconds, cells=0, allocated=0):
+        """This function adds one call of a stage to the statistics and calls the callbacks."""
+        statistics = self.stages.get(name)
+        if statistics is None:
+            statistics = self.stages[name] = {"calls": 0, "seconds": 0.0, "cells": 0, "allocated_bytes": 0}
+        statistics["calls"] += 1
+        statistics["seconds"] += seconds
+        statistics["cells"] += int(cells)
+        statistics["allocated_bytes"] = max(statistics["allocated_bytes"], int(allocated))
+
+        for callback in self.callbacks:
+            callback(name, seconds, cells, allocated)
+
+    def to_dict(self):
+        """Statistics per stage: calls, seconds, cells, cells per second and the largest allocation peak."""
+        return {name: dict(statistics, cells_per_second=statistics["cells"] / statistics["seconds"]
+                           if statistics["seconds"] else 0.0)
+                for name, statistics in self.stages.items()}
+
+    def to_json_lines(self, file_name=None):
+        """Statistics as JSON lines, one line per stage. They are appended to the file when a name is given."""
+        lines = "".join(json.dumps(dict(statistics, stage=name)) + "\n" for name, statistics in self.to_dict().items())
+        if file_name is not None:
+            with open(file_name, "a") as json_file:
+                json_file.write(lines)
+        return lines
+
+    def dump_profile(self, file_name):
+        """Store the cProfile statistics, e.g. for snakeviz or `pstats`."""
+        self.profile_stats.dump_stats(file_name)
+
+    def dump_memory_snapshot(self, file_name):
+        """Store the tracemalloc snapshot, to load with `tracemalloc.Snapshot.load`."""
+        self.memory_snapshot.dump(file_name)
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self.profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._token = _recorder.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _recorder.reset(self._token)
+        if self._profiler is not None:
+            self._profiler.disable()
+            self.profile_stats = pstats.Stats(self._profiler)
+            self._profiler = None
+        if self.trace_memory:
+            self.memory_snapshot = tracemalloc.take_snapshot()
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+
+class _Stage(object):
+    __slots__ = ("recorder", "name", "cells", "start", "memory")
+
+    def __init__(self, recorder, name, cells):
+        self.recorder = recorder
+        self.name = name
+        self.cells = cells
+
+    def __enter__(self):
+        self.memory = None
+        if self.recorder.trace_memory and tracemalloc.is_tracing():
+            self.memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        allocated = 0
+        if self.memory is not None:
+            allocated = max(tracemalloc.get_traced_memory()[1] - self.memory, 0)
+        self.recorder.record(self.name, seconds, self.cells, allocated)
+
+
+class _NoStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return None
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name, cells=0):
+    """This function returns a context manager that records a stage on the active `Recorder`. Without a recorder it
+    returns a shared context manager that does nothing, so the instrumentation costs one lookup of a context
+    variable when it is disabled.
+
+    Parameters:
+        name (str)      : Name of the stage.
+        cells (int)     : Number of cells that the stage processes.
+
+    Returns:
+        stage           : Context manager."""
+    recorder = _recorder.get()
+    if recorder is None:
+        return _NO_STAGE
+    return _Stage(recorder, name, cells)
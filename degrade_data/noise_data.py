@@ -5,57 +5,304 @@ import datetime
 from itertools import chain
 
 from degrade_data.restructure_data import read_and_shape_data, create_dict_alternatives
+from degrade_data.sampling import get_generator, choose_cells, legacy_index_numbers
+from degrade_data.instrumentation import stage
 
-def index_number(max_number, list_index_chosen):
-    """This function randomly defines an index number and ensures that no index number is assigned twice.
-    
-    Parameters:
-        max_number (int)            :Higher bound of the index number.
-        list_index_chosen (lst)     :List of indeces that have already been chosen.
-        
-    Returns:
-        index (int)                 :Index number."""
-    index = random.randint(0, max_number)
-
-    if index in list_index_chosen:
-        return index_number(max_number, list_index_chosen)
+NUMERIC = "numeric"
+DATE = "date"
+DATETIME = "datetime"
+TIME = "time"
+DATE64 = "datetime64[D]"
+DATETIME64 = "datetime64"
+TIMEDELTA64 = "timedelta64"
+CATEGORICAL = "categorical"
+CATEGORY_CODES = "category"
+UNKNOWN = "unknown"
 
-    list_index_chosen.append(index)
-    return index
+DATE_FORMAT = "%Y-%m-%d"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DATE_PATTERN = r"^\d{4}-\d{2}-\d{2}$"
+DATETIME_PATTERN = r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$"
+SECONDS_PER_DAY = 86400
+TYPED_KINDS = (DATE64, DATETIME64, TIMEDELTA64)
 
-def assign_noise(percentage, dataframe, percentage_noise_width=1, date_delta=182, dict_alternatives=None):
+def assign_noise(percentage, dataframe, percentage_noise_width=1, date_delta=182, dict_alternatives=None,
+                 legacy=False, rng=None):
     """This function assigns noise to an user-defined percentages values from the observed dataframe. Categorial units are replaced 
     by an alternative of a selected list. Numerical units are replace by alternative following a Normal distribution.
+    The kind of each column is determined once, after which the noise of all selected cells in that column is drawn
+    in one vectorized call.
     
     Parameters:
         percentage (int): Percentage of missing values.
         dataframe       : Dataframe of data to delete values. 
+        legacy (bool)   : Select the cells and draw the noise per cell with the global `random` and `np.random`
+                          state, as the original implementation did, to reproduce earlier seeded results.
+        rng             : Numpy Generator (or seed) used to select the cells and draw the noise. Ignored when legacy
+                          is True.
         
     Returns:
         noise_df      : Dataframe with noise given the percentage. """
 
+    if legacy:
+        return assign_noise_per_value(percentage, dataframe, percentage_noise_width, date_delta, dict_alternatives)
+
+    with stage("assign_noise", cells=dataframe.size):
+        rng = get_generator(rng)
+        mask = choose_cells(dataframe.shape, percentage, rng=rng)
+
+        noise_columns = {}
+        for position in range(dataframe.shape[1]):
+            column = dataframe.iloc[:, position]
+            rows = np.flatnonzero(mask[:, position])
+            if len(rows) == 0:
+                #Columns without selected cells are kept as they are, including their dtype
+                noise_columns[position] = column.array
+                continue
+
+            values = column.to_numpy()
+            kind = determine_column_kind(column, dict_alternatives)
+            if kind == NUMERIC:
+                values = values.astype(float)
+            elif kind in TYPED_KINDS:
+                values = values.copy()
+            elif kind == CATEGORY_CODES:
+                values = column.cat.codes.to_numpy().copy()
+            else:
+                values = values.astype(object)
+
+            alternatives = column.cat.categories if kind == CATEGORY_CODES else \
+                find_alternatives(column, dict_alternatives)
+            values[rows] = determine_noise_column(values[rows], kind, percentage_noise_width, date_delta, rng,
+                                                  alternatives=alternatives)
+            if kind == CATEGORY_CODES:
+                values = pd.Categorical.from_codes(values, dtype=column.dtype)
+
+            noise_columns[position] = values
+
+        #Reformat columns to dataframe
+        noise_df = pd.DataFrame(noise_columns, index=dataframe.index)
+        noise_df.columns = dataframe.columns
+
+    return noise_df
+
+def assign_noise_per_value(percentage, dataframe, percentage_noise_width=1, date_delta=182, dict_alternatives=None):
+    """This function assigns noise value by value with the global `random` and `np.random` state, in the same order
+    as the original implementation of `assign_noise`. It is only used to reproduce earlier seeded results.
+
+    Parameters:
+        percentage (int): Percentage of missing values.
+        dataframe       : Dataframe of data to delete values.
+
+    Returns:
+        noise_df      : Dataframe with noise given the percentage. """
+
     #Convert values of dataframe to one list
     list_data = [value for in_list in dataframe.values.tolist() for value in in_list]
 
     #Determine how many values need to be deleted
     num_choice = int(round(percentage*len(list_data)))
-    
+
     #Replace value with an alternative
-    list_index_chosen = []
-    num = 0 
-    for num in range(num_choice):
-        index = index_number(len(list_data)-1, list_index_chosen)
+    for index in legacy_index_numbers(len(list_data)-1, num_choice):
         list_data[index] = determine_noise(list_data[index], percentage_noise_width, date_delta, dict_alternatives)
-        num += 1
 
-    #Split the list in number of rows of dataframe
-    splitted_list = np.array_split(list_data, len(dataframe))
+    data = np.empty(len(list_data), dtype=object)
+    data[:] = list_data
 
-    #Reformat list to dataframe
-    noise_df = pd.DataFrame(data = splitted_list, columns=dataframe.columns.tolist())
+    noise_df = pd.DataFrame(data.reshape(dataframe.shape), index=dataframe.index,
+                            columns=dataframe.columns).infer_objects()
 
     return noise_df
 
+def determine_column_kind(column, dict_alternatives=None):
+    """This function determines once for a whole column which kind of noise applies to it: numeric (including the
+    negative Latitude and Longitude), date strings, datetime strings, `datetime.time` objects, typed datetime64 dates
+    (at midnight) or datetimes, typed timedelta64 times or categorial units with alternatives, either as values or
+    as the codes of a pandas Categorical (see `restructure_data.create_alternative_tables`). Columns of which the
+    kind is unknown receive None as noise, as in `determine_noise`.
+
+    Parameters:
+        column                     : Pandas Series.
+        dict_alternatives          : Dictonairy with column name as key and a list of alternatives as value.
+
+    Returns:
+        kind (str)                 : Kind of the column."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return CATEGORY_CODES
+
+    if pd.api.types.is_datetime64_any_dtype(column.dtype):
+        if (column.dropna() == column.dropna().dt.normalize()).all():
+            return DATE64
+        return DATETIME64
+
+    if pd.api.types.is_timedelta64_dtype(column.dtype):
+        return TIMEDELTA64
+
+    if pd.api.types.is_numeric_dtype(column.dtype) and not pd.api.types.is_bool_dtype(column.dtype):
+        return NUMERIC
+
+    values = pd.unique(column.dropna())
+    if len(values) == 0:
+        return UNKNOWN
+
+    if all(isinstance(value, (int, float, np.number)) and not isinstance(value, bool) for value in values):
+        return NUMERIC
+
+    if all(type(value) == datetime.time for value in values):
+        return TIME
+
+    if all(isinstance(value, str) for value in values):
+        strings = pd.Series(values)
+        for kind, pattern, date_format in [(DATE, DATE_PATTERN, DATE_FORMAT),
+                                           (DATETIME, DATETIME_PATTERN, DATETIME_FORMAT)]:
+            if strings.str.match(pattern).all() and \
+                    not pd.to_datetime(strings, format=date_format, errors="coerce").isna().any():
+                return kind
+
+    if find_alternatives(column, dict_alternatives) is not None:
+        return CATEGORICAL
+
+    return UNKNOWN
+
+def find_alternatives(column, dict_alternatives):
+    """This function finds the list of alternatives of a categorial column. The list under the column name is used
+    when it exists, otherwise the first list that contains all values of the column.
+
+    Parameters:
+        column                     : Pandas Series.
+        dict_alternatives          : Dictonairy with column name as key and a list of alternatives as value.
+
+    Returns:
+        list_alternatives          : List of alternatives, or None when there are no alternatives."""
+    if not dict_alternatives:
+        return None
+
+    if column.name in dict_alternatives:
+        return dict_alternatives[column.name]
+
+    values = set(column.dropna())
+    for list_alternatives in dict_alternatives.values():
+        if values.issubset(list_alternatives):
+            return list_alternatives
+
+    return None
+
+def determine_noise_column(values, kind, percentage_noise_width, date_delta, rng, alternatives=None):
+    """This function determines the noise for the selected values of one column in one vectorized call. It follows
+    the same distributions as `determine_noise`.
+
+    Parameters:
+        values                     : Numpy array with the selected values of the column.
+        kind (str)                 : Kind of the column, see `determine_column_kind`.
+        percentage_noise_width     : Percentage of the value that is marked as the standard deviation.
+        date_delta                 : Number of days that is used for the standard deviation of the date.
+        rng                        : Numpy Generator.
+        alternatives (lst)         : List of alternatives for categorial units.
+
+    Returns:
+        noise_values               : Numpy array with the values with noise."""
+    if kind == NUMERIC:
+        return noise_in_numbers(values, percentage_noise_width, rng)
+
+    if kind == DATE:
+        days = pd.to_datetime(values, format=DATE_FORMAT).values.astype("datetime64[D]").astype(np.int64)
+        noise_days = noise_in_days(days, date_delta, rng)
+        return np.datetime_as_string(noise_days.astype("datetime64[D]"), unit="D").astype(object)
+
+    if kind == DATETIME:
+        seconds = pd.to_datetime(values, format=DATETIME_FORMAT).values.astype("datetime64[s]").astype(np.int64)
+        days, seconds_of_day = np.divmod(seconds, SECONDS_PER_DAY)
+        noise_seconds = noise_in_days(days, date_delta, rng)*SECONDS_PER_DAY + \
+            noise_in_seconds(seconds_of_day, percentage_noise_width, rng)
+        return pd.DatetimeIndex(noise_seconds.astype("datetime64[s]")).strftime(DATETIME_FORMAT).to_numpy(dtype=object)
+
+    if kind == TIME:
+        seconds = np.array([value.hour*3600 + value.minute*60 + value.second for value in values], dtype=np.int64)
+        noise_seconds = noise_in_seconds(seconds, percentage_noise_width, rng)
+        return np.array([datetime.time(s // 3600, (s % 3600) // 60, s % 60) for s in noise_seconds.tolist()],
+                        dtype=object)
+
+    if kind in TYPED_KINDS:
+        return noise_in_typed(values, kind, percentage_noise_width, date_delta, rng)
+
+    if kind == CATEGORICAL:
+        return noise_in_categories(values, alternatives, rng)
+
+    if kind == CATEGORY_CODES:
+        return noise_in_codes(values, len(alternatives), rng)
+
+    return np.full(len(values), None, dtype=object)
+
+def noise_in_typed(values, kind, percentage_noise_width, date_delta, rng):
+    """Noise on typed dates, datetimes and times, computed on the whole array in days and seconds without formatting
+    strings. Dates get noise on the day, times of day (timedelta64 since midnight) on the seconds and datetimes on
+    both, with the same distributions as their string counterparts. Missing values (NaT) stay missing."""
+    missing = np.isnat(values)
+    noise_values = values.copy()
+
+    if kind == TIMEDELTA64:
+        seconds = values[~missing].astype("timedelta64[s]").astype(np.int64)
+        noise_seconds = noise_in_seconds(seconds, percentage_noise_width, rng)
+        noise_values[~missing] = noise_seconds.astype("timedelta64[s]")
+        return noise_values
+
+    seconds = values[~missing].astype("datetime64[s]").astype(np.int64)
+    days, seconds_of_day = np.divmod(seconds, SECONDS_PER_DAY)
+    noise_seconds = noise_in_days(days, date_delta, rng)*SECONDS_PER_DAY
+    if kind == DATETIME64:
+        noise_seconds = noise_seconds + noise_in_seconds(seconds_of_day, percentage_noise_width, rng)
+    noise_values[~missing] = noise_seconds.astype("datetime64[s]")
+
+    return noise_values
+
+def noise_in_numbers(values, percentage_noise_width, rng):
+    """Numerical units follow a Normal distribution with the value as mean and the user-defined percentage of the
+    value as standard deviation. Negative values (Latitude and Longitude) are drawn on their absolute value and stay
+    negative."""
+    return shift_numbers(values, percentage_noise_width, rng.standard_normal(len(values)))
+
+def shift_numbers(values, percentage_noise_width, standard_normal):
+    """Noise on numerical units for given draws of a standard Normal distribution, one per value (see
+    `noise_in_numbers`)."""
+    values = np.asarray(values, dtype=float)
+    absolute = np.abs(values)
+    noise_value = absolute + percentage_noise_width*absolute*standard_normal
+
+    return np.where(values >= 0, noise_value, -np.abs(noise_value))
+
+def noise_in_days(days, date_delta, rng):
+    """Dates, as number of days, follow a Normal distribution with the date as mean and the date delta as standard
+    deviation."""
+    return days + np.rint(rng.normal(0, date_delta, len(days))).astype(np.int64)
+
+def noise_in_seconds(seconds, percentage_noise_width, rng):
+    """Times of day, as number of seconds, follow a Normal distribution with the time as mean and the user-defined
+    percentage of the time as standard deviation. The result wraps around midnight."""
+    noise_value = np.rint(seconds + percentage_noise_width*seconds*rng.standard_normal(len(seconds)))
+
+    return np.mod(noise_value.astype(np.int64), SECONDS_PER_DAY)
+
+def noise_in_categories(values, alternatives, rng):
+    """Categorial units are replaced by one of the other alternatives following an Uniform distribution. Values
+    without alternatives become None."""
+    alternatives = np.asarray(alternatives, dtype=object)
+    codes = pd.Index(alternatives).get_indexer(values)
+
+    noise_values = alternatives[noise_in_codes(codes, len(alternatives), rng)]
+    noise_values[codes < 0] = None
+
+    return noise_values
+
+def noise_in_codes(codes, number_of_categories, rng):
+    """Codes of categorial units are replaced by one of the other codes following an Uniform distribution, for the
+    whole array at once. Missing codes (-1) stay missing."""
+    #Draw a different code by skipping the code of the current value
+    noise_codes = rng.integers(0, max(number_of_categories-1, 1), len(codes))
+    noise_codes = noise_codes + (noise_codes >= codes)
+
+    return np.where(codes < 0, -1, np.minimum(noise_codes, number_of_categories-1))
+
 # %%
 def determine_noise(value, percentage_noise_width, date_delta, dict_alternatives):
     """This function determines noise for a specific value. Categorial units are replaced by an alternative 
@@ -82,6 +329,19 @@ def determine_noise(value, percentage_noise_width, date_delta, dict_alternatives
             noise_value = -abs(np.random.normal(abs(value), percentage_noise_width*abs(value)))
             return noise_value
 
+    if isinstance(value, pd.Timedelta):
+        #For typed times of day
+        return pd.Timedelta(seconds=noise_in_time_seconds(int(value.total_seconds()), percentage_noise_width))
+
+    if isinstance(value, pd.Timestamp):
+        #For typed dates and date times with the use of proleptic Gregorian ordinal
+        noise_date = datetime.date.fromordinal(round(np.random.normal(value.toordinal(), date_delta)))
+        noise_value = pd.Timestamp(noise_date)
+        if value != value.normalize():
+            seconds = value.hour*3600 + value.minute*60 + value.second
+            noise_value += pd.Timedelta(seconds=noise_in_time_seconds(seconds, percentage_noise_width))
+        return noise_value
+
     if type(value) == datetime.time:
         noise_value_time = noise_in_time(value, percentage_noise_width)
 
@@ -120,7 +380,7 @@ def determine_noise(value, percentage_noise_width, date_delta, dict_alternatives
                                 if value in list_alt][0]
 
             #Remove the current value from list of alternatives
-            dict_alt_without_value = dict_alt[key_name_noise].copy()
+            dict_alt_without_value = list(dict_alternatives[key_name_noise])
             dict_alt_without_value.remove(value)
 
             noise_value = random.sample(dict_alt_without_value, k = 1)[0]
@@ -148,4 +408,8 @@ def noise_in_time(value, percentage_noise_width):
 
     noise_value_time = datetime.time(noise_value_hour, (noise_value % 3600) // 60, noise_value % 60)
 
-    return noise_value_time
\ No newline at end of file
+    return noise_value_time
+
+def noise_in_time_seconds(seconds, percentage_noise_width):
+    """Noise on a time of day in seconds, wrapped around midnight, as in `noise_in_time`."""
+    return round(np.random.normal(seconds, percentage_noise_width * seconds)) % SECONDS_PER_DAY
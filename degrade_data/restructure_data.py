@@ -1,20 +1,68 @@
 import pandas as pd
 
-def read_and_shape_data(file_name):
+try:
+    import python_calamine
+except ImportError:
+    python_calamine = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+def excel_engine():
+    """This function returns the fastest available engine to read Excel files: calamine (pandas 2.2 or later with
+    python-calamine installed) or otherwise the default engine of pandas (None)."""
+    major, minor = (int(part) for part in pd.__version__.split(".")[:2])
+    if python_calamine is not None and (major, minor) >= (2, 2):
+        return "calamine"
+    return None
+
+def csv_engine():
+    """This function returns the fastest available engine to read csv files: pyarrow (pandas 1.4 or later with
+    pyarrow installed) or otherwise the default engine of pandas (None)."""
+    major, minor = (int(part) for part in pd.__version__.split(".")[:2])
+    if pyarrow is not None and (major, minor) >= (1, 4):
+        return "pyarrow"
+    return None
+
+def read_table(file_name):
+    """This function reads the export of the Simio simulation model: a csv file when the name ends with ".csv",
+    otherwise the Excel file with the name and extension ".xlsx", with the fastest available engine.
+
+    Parameters:
+        file_name (str): Name of the csv file or of the excel input file without extension.
+
+    Returns:
+        observed_data: Dataframe of the input file."""
+    if file_name.lower().endswith(".csv"):
+        return pd.read_csv(file_name, engine=csv_engine())
+
+    return pd.read_excel(file_name+".xlsx", engine=excel_engine())
+
+def read_and_shape_data(file_name, typed=False):
     """This function reads and reshapes the Excel file from the Simio simulation model. It reshapes the DateTime
-    retrieved from Simio and restructures the columns.
+    retrieved from Simio and restructures the columns. By default the Date becomes a "%Y-%m-%d" string and the Time a
+    `datetime.time`. In typed mode, the Date is kept as datetime64 (at midnight) and the Time as the timedelta64
+    since midnight, so that the noise can be added to whole columns without formatting and parsing strings.
     
     Parameters:
-        file_name (str): Name of excel input file of type ".xlsx".
+        file_name (str): Name of excel input file of type ".xlsx" (without extension) or of a ".csv" file.
+        typed (bool)   : Keep Date and Time as datetime64 and timedelta64. Default is False.
     
     Returns:
         observed_data: Dataframe from reshaped excel input file."""
 
     #observed_data = pd.read_excel("data/"+file_name+".xlsx").dropna(axis=0, how = "all")
-    observed_data = pd.read_excel(file_name+".xlsx").dropna(axis=0, how = "all")
+    observed_data = read_table(file_name).dropna(axis=0, how = "all")
 
-    observed_data['Date'] = [d.date().strftime("%Y-%m-%d") for d in observed_data["DateTime"]]
-    observed_data['Time'] = [d.time() for d in observed_data["DateTime"]]
+    date_time = pd.to_datetime(observed_data["DateTime"])
+    if typed:
+        observed_data['Date'] = date_time.dt.normalize()
+        observed_data['Time'] = date_time - observed_data['Date']
+    else:
+        observed_data['Date'] = [d.date().strftime("%Y-%m-%d") for d in date_time]
+        observed_data['Time'] = [d.time() for d in date_time]
 
     observed_data = observed_data.astype({"NumChainPosition":"int64"})
     observed_data = observed_data.drop(columns=["DateTime", "ChainPosition", "Location"])
@@ -47,14 +95,35 @@ def create_dict_alternatives(dataframe, column_names, add_alt=None):
     for name in column_names:
         list_alternatives = list(dataframe[name].dropna().unique())
 
-        if str(name) in add_alt.keys():
-            list_alternatives.append(add_alt[name])
+        if add_alt and name in add_alt:
+            additional = add_alt[name] if isinstance(add_alt[name], (list, tuple, set)) else [add_alt[name]]
+            list_alternatives.extend(value for value in additional if value not in list_alternatives)
 
         dict_alternatives[name] = list_alternatives
         continue 
 
     return dict_alternatives
 
+def create_alternative_tables(dataframe, column_names, add_alt=None):
+    """This function creates a table of alternatives per categorial column as a pandas CategoricalDtype, so that the
+    column can be stored as integer codes and noise can draw a different code for a whole column at once.
+
+    Parameters:
+        dataframe                   : Pandas DataFrame.
+        column_names (list)         : Name of columns which require alternatives.
+        add_alt(dict)               : Additional alternatives with column name as key and a list of alternatives as value
+
+    Returns:
+        alternative_tables          : Dictonairy with column name as key and a CategoricalDtype as value."""
+    dict_alternatives = create_dict_alternatives(dataframe, column_names, add_alt)
+
+    return {name: pd.CategoricalDtype(list_alternatives) for name, list_alternatives in dict_alternatives.items()}
+
+def encode_categorical(dataframe, alternative_tables):
+    """This function encodes the categorial columns of a dataframe as pandas Categoricals with the alternatives of
+    `create_alternative_tables` as categories. Values that are not an alternative become missing."""
+    return dataframe.astype(alternative_tables)
+
 def combine_lat_lon(dataframe):
     """This function combines the Latitude and Longitude column into one column.
     
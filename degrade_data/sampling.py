@@ -0,0 +1,64 @@
+import random
+import numpy as np
+
+
+def get_generator(rng=None):
+    """This function returns the random number generator used by the degradation functions. Every random draw
+    comes from an explicit generator, so that degradations can run concurrently in threads or processes and give
+    the same results in any order. Only the legacy modes use the global `random` state.
+
+    Parameters:
+        rng         : Numpy Generator, SeedSequence (e.g. from `SeedSequence.spawn`), seed or sequence of seeds,
+                      or None for a generator seeded from fresh entropy.
+
+    Returns:
+        rng         : Numpy Generator."""
+    if isinstance(rng, np.random.Generator):
+        return rng
+    return np.random.default_rng(rng)
+
+def legacy_index_numbers(max_number, num_choice):
+    """This function draws index numbers in exactly the same order as repeated calls to the recursive
+    `index_number`, so that earlier seeded results can be reproduced. It draws iteratively and checks the
+    membership against a set instead of a list.
+
+    Parameters:
+        max_number (int)            :Higher bound of the index number.
+        num_choice (int)            :Number of index numbers to choose.
+
+    Returns:
+        list_index_chosen (lst)     :List of unique index numbers in the order they were drawn."""
+    set_index_chosen = set()
+    list_index_chosen = []
+    while len(list_index_chosen) < num_choice:
+        index = random.randint(0, max_number)
+        if index in set_index_chosen:
+            continue
+
+        set_index_chosen.add(index)
+        list_index_chosen.append(index)
+
+    return list_index_chosen
+
+def choose_cells(shape, percentage, rng=None, legacy=False):
+    """This function selects an user-defined percentage of the cells of a table at once, without replacement. The
+    cells are numbered row by row, as in the flattened list of the original implementation.
+
+    Parameters:
+        shape (tuple)       : Number of rows and columns of the table.
+        percentage (float)  : Percentage of cells to select.
+        rng                 : Numpy Generator. Ignored when legacy is True.
+        legacy (bool)       : Draw the cells with the global `random` state, as the original implementation did.
+
+    Returns:
+        mask                : Boolean array of the given shape, True for the selected cells."""
+    size = int(np.prod(shape))
+    num_choice = int(round(percentage*size))
+
+    mask = np.zeros(size, dtype=bool)
+    if legacy:
+        mask[legacy_index_numbers(size-1, num_choice)] = True
+    else:
+        mask[get_generator(rng).choice(size, size=num_choice, replace=False)] = True
+
+    return mask.reshape(shape)
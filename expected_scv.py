@@ -0,0 +1,198 @@
+import math
+import numpy as np
+
+from ground_truth import GroundTruthProfile
+
+#Moments of |z| for a standard normal z
+MEAN_ABS_NORMAL = math.sqrt(2 / math.pi)
+
+
+def _log_choose(n, k):
+    lgamma = np.vectorize(math.lgamma, otypes=[float])
+    return lgamma(n + 1) - lgamma(k + 1) - lgamma(n - k + 1)
+
+def hypergeometric_moments(function, population, successes, draws):
+    """ Mean and variance of function(x) for x the number of successes when drawing without replacement from a
+    population, summed over the support of the hypergeometric distribution (within 12 standard deviations). """
+    low, high = max(0, draws - (population - successes)), min(successes, draws)
+    if population > 1:
+        mean = draws * successes / population
+        sd = math.sqrt(draws * (successes / population) * (1 - successes / population)
+                       * (population - draws) / (population - 1))
+        low, high = max(low, int(mean - 12 * sd) - 1), min(high, int(mean + 12 * sd) + 1)
+
+    x = np.arange(low, high + 1)
+    log_pmf = _log_choose(successes, x) + _log_choose(population - successes, draws - x) - \
+        _log_choose(population, draws)
+    pmf = np.exp(log_pmf - log_pmf.max())
+    pmf = pmf / pmf.sum()
+
+    values = function(x)
+    mean = np.sum(pmf * values)
+    return mean, np.sum(pmf * (values - mean) ** 2)
+
+def _selection(profile, percentage, names_nodes):
+    """ How the cells are selected. A single percentage selects cells over the whole table, except the last two
+    columns, as `create_missing_value_df` and `create_noise_df` do; a percentage per node selects rows per column, as
+    in the scenarios. Returns the population, number of draws per node and whether the draws share one table. """
+    rows = profile.values.shape[0]
+    positions = [profile.columns.index(name) for name in names_nodes]
+
+    if np.ndim(percentage) == 0:
+        eligible = np.array([position < len(profile.columns) - 2 for position in positions])
+        population = rows * max(len(profile.columns) - 2, 0)
+        draws = int(round(percentage * population))
+        return population, np.where(eligible, draws, 0), eligible, True
+
+    draws = np.array([int(round(p * rows)) for p in percentage])
+    return rows, draws, np.ones(len(positions), dtype=bool), False
+
+def expected_visibility_missing(profile, percentage, names_nodes):
+    """ Expected visibility per node and its covariance matrix when values are missing completely at random. The
+    degraded values equal the ground truth, so the quality stays 100 and the visibility of a node only depends on
+    the number of its values that are removed, which follows a hypergeometric distribution. The covariance between
+    nodes that share one table follows from the multivariate hypergeometric distribution (delta method). """
+    population, draws, eligible, shared = _selection(profile, percentage, names_nodes)
+    full_count = profile.node_constants(names_nodes)["full_count"].astype(float)
+
+    mean = np.full(len(names_nodes), 100.0)
+    quantity = np.full(len(names_nodes), 100.0)
+    covariance = np.zeros((len(names_nodes), len(names_nodes)))
+    slope = np.zeros(len(names_nodes))
+
+    for node, (count, draw) in enumerate(zip(full_count, draws)):
+        if not eligible[node] or draw == 0 or count == 0:
+            continue
+        visibility = lambda removed: 100 * np.sqrt(np.maximum(0, 1 - removed / count))
+        mean[node], covariance[node, node] = hypergeometric_moments(visibility, population, int(count), int(draw))
+
+        expected_removed = draw * count / population
+        quantity[node] = 100 * (1 - expected_removed / count)
+        remaining = max(1 - expected_removed / count, 1e-12)
+        slope[node] = -50 / (count * math.sqrt(remaining))
+
+    if shared and population > 1:
+        draw = draws.max() if len(draws) else 0
+        factor = -draw * (population - draw) / (population - 1) / population ** 2
+        cross = factor * np.outer(full_count * eligible, full_count * eligible) * np.outer(slope, slope)
+        np.fill_diagonal(cross, 0)
+        covariance += cross
+
+    return mean, covariance, quantity, np.full(len(names_nodes), 100.0)
+
+def _abs_error_moments(percentage_noise_width, negative):
+    """ First and second moment of the absolute error of a noisy value, relative to the absolute value. Positive
+    values get |w z|; negative values (Latitude and Longitude) get |1 - |1 + w z||, computed by Gauss-Hermite
+    quadrature. """
+    if not negative:
+        return percentage_noise_width * MEAN_ABS_NORMAL, percentage_noise_width ** 2
+
+    points, weights = np.polynomial.hermite.hermgauss(80)
+    z = math.sqrt(2) * points
+    error = np.abs(1 - np.abs(1 + percentage_noise_width * z))
+    weights = weights / math.sqrt(math.pi)
+    return np.sum(weights * error), np.sum(weights * error ** 2)
+
+def expected_visibility_noise(profile, percentage, names_nodes, percentage_noise_width=1):
+    """ Approximate expected visibility per node and its covariance matrix when noise is added to randomly selected
+    values. The absolute error of the quality is a sum over the selected values, of which the mean and variance
+    follow from the selection without replacement and the moments of the Normal noise. The square root of the
+    visibility is expanded to second order around the expected quality (delta method); the truncation of the
+    quality at zero is ignored. """
+    population, draws, eligible, shared = _selection(profile, percentage, names_nodes)
+    positions = [profile.columns.index(name) for name in names_nodes]
+
+    mean = np.full(len(names_nodes), 100.0)
+    quality = np.full(len(names_nodes), 100.0)
+    variance_error = np.zeros(len(names_nodes))
+    scale = np.zeros(len(names_nodes))
+    slope = np.zeros(len(names_nodes))
+    absolute_mean = np.zeros(len(names_nodes))
+
+    for node, position in enumerate(positions):
+        values = profile.values[:, position]
+        values = values[~np.isnan(values)]
+        actual_sum = abs(values.sum())
+        absolute = np.abs(values)
+        if not eligible[node] or draws[node] == 0 or absolute.sum() == 0 or actual_sum == 0:
+            continue
+
+        chosen = draws[node] / population
+        moments = [_abs_error_moments(percentage_noise_width, negative) for negative in (False, True)]
+        m1 = np.where(values >= 0, moments[0][0], moments[1][0])
+        m2 = np.where(values >= 0, moments[0][1], moments[1][1])
+        absolute_mean[node] = np.sum(absolute * m1)
+
+        expected_error = chosen * absolute_mean[node]
+        variance = chosen * np.sum(m2 * absolute ** 2) - chosen ** 2 * np.sum((m1 * absolute) ** 2)
+        if population > 1:
+            variance -= chosen * (1 - chosen) / (population - 1) * \
+                (absolute_mean[node] ** 2 - np.sum((m1 * absolute) ** 2))
+        variance_error[node] = max(variance, 0)
+
+        scale[node] = 100 / actual_sum
+        quality[node] = 100 - scale[node] * expected_error
+        if quality[node] <= 0:
+            mean[node] = 0
+            continue
+
+        variance_quality = scale[node] ** 2 * variance_error[node]
+        mean[node] = 10 * math.sqrt(quality[node]) - 0.5 * 2.5 * quality[node] ** -1.5 * variance_quality
+        slope[node] = 5 / math.sqrt(quality[node])
+
+    covariance = np.diag((slope * scale) ** 2 * variance_error)
+    if shared and population > 1:
+        chosen = draws.max() / population
+        factor = -chosen * (1 - chosen) / (population - 1)
+        gradient = slope * scale * absolute_mean
+        cross = factor * np.outer(gradient, gradient)
+        np.fill_diagonal(cross, 0)
+        covariance += cross
+
+    return mean, covariance, np.full(len(names_nodes), 100.0), quality
+
+def expected_supply_chain_visibility(data_set, percentage, names_nodes, dim_sparseness="missing",
+                                     percentage_noise_width=1):
+    """ Expected global supply chain visibility and its variance, computed directly from the ground truth instead
+    of from random seeds. The percentage is either one percentage for the whole data set, as in
+    `calculate_supply_chain_visibility`, or a percentage per node, as in the scenarios. The estimate is exact for
+    missing values (up to the covariance between nodes) and a moment approximation for noise.
+
+    Returns a dictionary with the expected global visibility ("expected_scv"), its variance ("variance") and the
+    expected visibility, variance, quantity and quality per node ("expected_scv_nodes", "variance_nodes",
+    "expected_quantity_nodes", "expected_quality_nodes"). """
+    profile = data_set if isinstance(data_set, GroundTruthProfile) else GroundTruthProfile(data_set)
+
+    if str.lower(dim_sparseness) == "missing":
+        mean, covariance, quantity, quality = expected_visibility_missing(profile, percentage, names_nodes)
+    elif str.lower(dim_sparseness) == "noise":
+        mean, covariance, quantity, quality = expected_visibility_noise(profile, percentage, names_nodes,
+                                                                       percentage_noise_width)
+    else:
+        raise ValueError("No analytical estimator for the dimension {0}".format(dim_sparseness))
+
+    weights = profile.inventory_weights(names_nodes)
+
+    return {"expected_scv": float(weights @ mean),
+            "variance": float(max(weights @ covariance @ weights, 0)),
+            "expected_scv_nodes": mean,
+            "variance_nodes": np.diag(covariance).copy(),
+            "expected_quantity_nodes": quantity,
+            "expected_quality_nodes": quality}
+
+def compare_with_monte_carlo(estimate, scv_per_seed):
+    """ Error of an analytical estimate against the global visibility of Monte Carlo seeds: the difference of the
+    means, the standard error of the Monte Carlo mean, the z-score of the difference and the ratio of the standard
+    deviations. """
+    scv_per_seed = np.asarray(scv_per_seed, dtype=float)
+    monte_carlo_mean = scv_per_seed.mean()
+    standard_error = scv_per_seed.std(ddof=1) / math.sqrt(len(scv_per_seed)) if len(scv_per_seed) > 1 else np.nan
+    error = estimate["expected_scv"] - monte_carlo_mean
+
+    return {"expected_scv": estimate["expected_scv"],
+            "monte_carlo_mean": monte_carlo_mean,
+            "absolute_error": abs(error),
+            "standard_error": standard_error,
+            "z_score": error / standard_error if standard_error else np.nan,
+            "std_ratio": math.sqrt(estimate["variance"]) / scv_per_seed.std(ddof=1) if len(scv_per_seed) > 1
+            else np.nan}
@@ -0,0 +1,297 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+
+
+def ground_truth_constants(values):
+    """ Constants per node (column) of the ground truth that do not change between degradation runs: the number of
+    values that are not missing and the sum and mean of those values (the average inventory). """
+    present = ~np.isnan(values)
+    present_values = np.where(present, values, 0)
+
+    full_count = present.sum(axis=0)
+    inventory_sum = present_values.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        average_inventory = inventory_sum / full_count
+
+    return {"full_count": full_count,
+            "inventory_sum": inventory_sum,
+            "average_inventory": average_inventory}
+
+
+def hash_ground_truth(data_set):
+    """ Hash of the content of a data set: its values, index and column names. """
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(data_set, index=True).to_numpy().tobytes())
+    digest.update(repr(list(data_set.columns)).encode())
+
+    return digest.hexdigest()
+
+
+class GroundTruthProfile(object):
+    """ Ground truth together with its constants per node, built once and reused by every degradation run of a sweep,
+    so that only the statistics of the degraded data set are computed per run. The constants are the number of
+    values that are not missing, the sum of the values (the denominator of the mean absolute percentage error when
+    no rows are missing) and the average inventory. The profile is keyed by a hash of the content of the ground
+    truth. """
+
+    def __init__(self, frame, constants=None, content_hash=None):
+        self.frame = frame
+        self.columns = list(frame.columns)
+        self.values = frame.to_numpy(dtype=float)
+
+        if constants is None:
+            constants = ground_truth_constants(self.values)
+        self.full_count = constants["full_count"]
+        self.inventory_sum = constants["inventory_sum"]
+
+        self._content_hash = content_hash
+
+    @property
+    def content_hash(self):
+        if self._content_hash is None:
+            self._content_hash = hash_ground_truth(self.frame)
+        return self._content_hash
+
+    @property
+    def average_inventory(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.inventory_sum / self.full_count
+
+    def node_constants(self, names_nodes):
+        """ Constants of the given nodes, in the order of the names. """
+        positions = [self.columns.index(name) for name in names_nodes]
+        return {"full_count": self.full_count[positions],
+                "inventory_sum": self.inventory_sum[positions]}
+
+    def inventory_weights(self, names_nodes):
+        """ Average inventory of the given nodes, normalized to sum up to 1. """
+        positions = [self.columns.index(name) for name in names_nodes]
+        average_inventory = self.average_inventory[positions]
+        return average_inventory / np.sum(average_inventory)
+
+    def save(self, directory):
+        """ Save the profile as "<content hash>.npz" in the directory and return the file name. """
+        file_name = os.path.join(directory, self.content_hash + ".npz")
+        index = self.frame.index
+        np.savez(file_name, values=self.values, index=index.to_numpy(), index_name=np.array(str(index.name or "")),
+                 columns=np.array(self.columns, dtype=str), full_count=self.full_count,
+                 inventory_sum=self.inventory_sum, content_hash=np.array(self.content_hash))
+        return file_name
+
+    @classmethod
+    def load(cls, file_name):
+        """ Load a profile that was saved with `save`. """
+        with np.load(file_name, allow_pickle=False) as stored:
+            index = pd.Index(stored["index"], name=str(stored["index_name"]) or None)
+            frame = pd.DataFrame(stored["values"], index=index, columns=stored["columns"].tolist())
+            constants = {name: stored[name] for name in ["full_count", "inventory_sum"]}
+            return cls(frame, constants, content_hash=str(stored["content_hash"]))
+
+    @classmethod
+    def load_or_create(cls, data_set, directory):
+        """ Load the profile of a data set from the directory when it was saved before, otherwise create and save
+        it. """
+        profile = cls(data_set)
+        file_name = os.path.join(directory, profile.content_hash + ".npz")
+        if os.path.exists(file_name):
+            return cls.load(file_name)
+
+        os.makedirs(directory, exist_ok=True)
+        profile.save(directory)
+        return profile
+
+
+class SharedGroundTruth(object):
+    """ Read-only ground truth in shared memory, together with its constants per node. The process that creates it
+    owns the memory; worker processes attach to it by its descriptor instead of receiving a copy of the data set.
+    The values and the constants are stored in one block of (time steps + 2) rows by nodes. """
+
+    def __init__(self, shm, descriptor, owner=False):
+        self._shm = shm
+        self.descriptor = descriptor
+        self.owner = owner
+
+        rows, columns = descriptor["shape"]
+        block = np.ndarray((rows + 2, columns), dtype=np.float64, buffer=shm.buf)
+        block.flags.writeable = False
+
+        self.columns = descriptor["columns"]
+        self.index = descriptor["index"]
+        self.values = block[:rows]
+        self.full_count = block[rows]
+        self.inventory_sum = block[rows + 1]
+
+    @classmethod
+    def create(cls, data_set):
+        """ Copy a data set (or a `GroundTruthProfile`) and its constants into a new block of shared memory. """
+        profile = data_set if isinstance(data_set, GroundTruthProfile) else GroundTruthProfile(data_set)
+        data_set = profile.frame
+        values = profile.values
+        block_data = np.vstack([values, profile.full_count, profile.inventory_sum])
+        shm = shared_memory.SharedMemory(create=True, size=max(block_data.nbytes, 1))
+        block = np.ndarray(block_data.shape, dtype=np.float64, buffer=shm.buf)
+        block[:] = block_data
+
+        descriptor = {"name": shm.name,
+                      "shape": values.shape,
+                      "columns": list(data_set.columns),
+                      "index": data_set.index,
+                      "content_hash": profile.content_hash}
+
+        return cls(shm, descriptor, owner=True)
+
+    @classmethod
+    def attach(cls, descriptor):
+        """ Attach to a ground truth that was created by another process. """
+        shm = shared_memory.SharedMemory(name=descriptor["name"])
+
+        return cls(shm, descriptor, owner=False)
+
+    def to_frame(self):
+        """ Data frame on top of the shared values, without copying them. """
+        return pd.DataFrame(self.values, index=self.index, columns=self.columns, copy=False)
+
+    def to_profile(self):
+        """ `GroundTruthProfile` on top of the shared values and constants, without copying them. """
+        constants = {"full_count": self.full_count, "inventory_sum": self.inventory_sum}
+        return GroundTruthProfile(self.to_frame(), constants, content_hash=self.descriptor.get("content_hash"))
+
+    def close(self):
+        """ Detach from the shared memory; the owner also releases it. """
+        self.values = self.full_count = self.inventory_sum = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass #a data frame on top of the values is still alive; the mapping is released with it
+        if self.owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_actor_columns(file_name, time_column="Time", replication_column="Replications"):
+    """ Names of the actor columns of a time series export: all columns except the time, the replication and the
+    unnamed index column. """
+    columns = pd.read_csv(file_name, nrows=0).columns
+    return [name for name in columns if name not in (time_column, replication_column)
+            and not name.startswith("Unnamed")]
+
+def _read_chunks(file_name, chunksize, time_column, replication_column, dtype):
+    """ Read a time series export in chunks with explicit dtypes for the time, replication and actor columns. """
+    actors = read_actor_columns(file_name, time_column, replication_column)
+    dtypes = {name: dtype for name in actors}
+    dtypes.update({time_column: "float64", replication_column: "int32"})
+
+    chunks = pd.read_csv(file_name, usecols=[time_column] + actors + [replication_column], dtype=dtypes,
+                         chunksize=chunksize)
+    return actors, chunks
+
+def replication_statistics(file_name, chunksize=100000, time_column="Time", replication_column="Replications",
+                           dtype="float32"):
+    """ Mean, number and (sample) variance of the values of each actor per time step over the replications of a
+    time series export. The file is read in chunks and the statistics are merged per chunk with the parallel
+    algorithm of Chan et al., so the replications are never held in memory at once.
+
+    Parameters:
+        file_name (str)             : Name of the csv file, e.g. in the "data" folder.
+        chunksize (int)             : Number of rows to read at once.
+        time_column (str)           : Name of the time column.
+        replication_column (str)    : Name of the replication column.
+        dtype                       : Dtype to read the actor columns with.
+
+    Returns:
+        mean                        : Dataframe with the mean per time step (the ground truth).
+        count                       : Dataframe with the number of values per time step.
+        variance                    : Dataframe with the variance per time step."""
+    actors, chunks = _read_chunks(file_name, chunksize, time_column, replication_column, dtype)
+
+    count = mean = m2 = None
+    for chunk in chunks:
+        #Accumulate in double precision, whatever the dtype of the file
+        grouped = chunk.astype({name: "float64" for name in actors}).groupby(time_column)[actors]
+        count_chunk = grouped.count().astype(float)
+        mean_chunk = grouped.mean().astype(float)
+        m2_chunk = (grouped.var(ddof=0).astype(float) * count_chunk).fillna(0)
+
+        if count is None:
+            count, mean, m2 = count_chunk, mean_chunk.fillna(0), m2_chunk
+            continue
+
+        count_chunk, count = count_chunk.align(count, fill_value=0)
+        mean_chunk, mean = mean_chunk.fillna(0).align(mean, fill_value=0)
+        m2_chunk, m2 = m2_chunk.align(m2, fill_value=0)
+
+        total = count + count_chunk
+        delta = mean_chunk - mean
+        ratio = (count_chunk / total).fillna(0)
+        mean = mean + delta * ratio
+        m2 = m2 + m2_chunk + delta ** 2 * count * ratio
+        count = total
+
+    mean = mean.where(count > 0)
+    variance = (m2 / (count - 1)).where(count > 1)
+
+    return mean, count.astype("int64"), variance
+
+def read_ground_truth(file_name, chunksize=100000, time_column="Time", replication_column="Replications",
+                      dtype="float32"):
+    """ Ground truth of a time series export: the mean of each actor per time step over the replications, read in
+    chunks (see `replication_statistics`). """
+    mean, count, variance = replication_statistics(file_name, chunksize, time_column, replication_column, dtype)
+    return mean
+
+def iter_replications(file_name, chunksize=100000, time_column="Time", replication_column="Replications",
+                      dtype="float32"):
+    """ Generator of the ground truth per replication of a time series export, as tuples of the replication number
+    and a dataframe indexed by time step. The rows of a replication must be contiguous in the file; only the
+    current replication is held in memory. """
+    actors, chunks = _read_chunks(file_name, chunksize, time_column, replication_column, dtype)
+
+    pieces = []
+    current = None
+    for chunk in chunks:
+        for replication, piece in chunk.groupby(replication_column, sort=False):
+            if current is not None and replication != current:
+                yield current, pd.concat(pieces).set_index(time_column)[actors]
+                pieces = []
+            current = replication
+            pieces.append(piece)
+
+    if pieces:
+        yield current, pd.concat(pieces).set_index(time_column)[actors]
+
+def stack_replications(file_names, chunksize=100000, time_column="Time", replication_column="Replications",
+                       dtype="float32"):
+    """ Ground truths of all replications of one or more time series exports (e.g. one per configuration of the
+    simulation model) stacked in one array shaped (configuration, replication, time step, actor), for batch scoring.
+    The files are read per replication (see `iter_replications`). Replications are aligned on the union of the time
+    steps and configurations with fewer replications are padded; missing values are NaN.
+
+    Returns:
+        values                      : Float64 array shaped (configuration, replication, time step, actor).
+        replications                : List with the replication numbers per configuration.
+        times                       : Time steps.
+        actors                      : Names of the actors, the same for all files."""
+    frames = [dict(iter_replications(file_name, chunksize, time_column, replication_column, dtype))
+              for file_name in file_names]
+    actors = read_actor_columns(file_names[0], time_column, replication_column)
+
+    times = pd.Index([])
+    for replications in frames:
+        for frame in replications.values():
+            times = times.union(frame.index)
+
+    values = np.full((len(frames), max(len(replications) for replications in frames), len(times), len(actors)),
+                     np.nan)
+    for configuration, replications in enumerate(frames):
+        for position, frame in enumerate(replications.values()):
+            values[configuration, position] = frame[actors].reindex(times).to_numpy(dtype=float)
+
+    return values, [list(replications) for replications in frames], times, actors
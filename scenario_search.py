@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+
+from calculate_scv import degrade_scenario_array, finalize_visibility, visibility_statistics
+from degrade_data.noise_data import shift_numbers
+from ground_truth import GroundTruthProfile
+from sweep_result import interval_quantile
+
+
+class NodeResponseCurves(object):
+    """ Visibility of every node for a grid of percentages of noise and of missing values, per seed: an array "scv"
+    shaped (seed, node, noise level, missing level). The visibility of a node only depends on the degradation of
+    that node and the global visibility weighs the nodes by their average inventory in the ground truth, so the
+    global visibility of any vector of percentages per node is a weighted sum of the curves, without degrading the
+    data set again.
+
+    All levels and candidates share the random numbers of a seed (common random numbers): the bias of a seed is the
+    same for every candidate and each node draws one order of its rows and one noise value per row from its own
+    random stream, so a higher percentage degrades the rows of a lower percentage, and more. Differences between
+    candidates therefore have far less variance than independent sweeps of each candidate. """
+
+    def __init__(self, scv, names_nodes, levels_nodes, levels_noise, levels_missing, weights, seeds,
+                 percentage_bias=0.25):
+        self.scv = scv
+        self.names_nodes = list(names_nodes)
+        self.levels_nodes = list(levels_nodes)
+        self.levels_noise = list(levels_noise)
+        self.levels_missing = list(levels_missing)
+        self.weights = weights
+        self.seeds = list(seeds)
+        self.percentage_bias = percentage_bias
+
+    @property
+    def mean(self):
+        """ Mean visibility over the seeds, shaped (node, noise level, missing level). """
+        return np.nanmean(self.scv, axis=0)
+
+    def global_scv(self, noise_index, missing_index):
+        """ Global visibility per seed of a candidate, given as the index of the level of noise and of missing
+        values per node. """
+        nodes = np.arange(len(self.names_nodes))
+        return np.sum(self.scv[:, nodes, noise_index, missing_index] * self.weights, axis=-1)
+
+    def expected_scv(self, noise_index, missing_index):
+        return float(np.mean(self.global_scv(noise_index, missing_index)))
+
+
+def node_response_curves(data_set, names_nodes, levels_nodes, levels_noise, levels_missing, percentage_bias=0.25,
+                         seeds=range(1, 51), percentage_noise_width=1):
+    """ Degrade and score every node for every combination of the levels of noise and missing values, for each seed
+    (see `NodeResponseCurves`). Per seed, the bias is applied to the rows of the whole data set as in
+    `degrade_scenario_array`, and each node degrades its biased column with noise and then missing values from the
+    random stream of the seed and the position of the node. The data set is either a data frame or a
+    `GroundTruthProfile`.
+
+    Returns a `NodeResponseCurves`. """
+    profile = data_set if isinstance(data_set, GroundTruthProfile) else GroundTruthProfile(data_set)
+    names_nodes = list(names_nodes)
+    seeds = list(seeds)
+    positions = [profile.columns.index(name) for name in names_nodes]
+    full = profile.values[:, positions]
+    full_constants = profile.node_constants(names_nodes)
+    rows = len(full)
+
+    counts_noise = [int(round(percentage*rows)) for percentage in levels_noise]
+    counts_missing = [int(round(percentage*rows)) for percentage in levels_missing]
+
+    scv = np.empty((len(seeds), len(names_nodes), len(levels_noise), len(levels_missing)))
+    for index_seed, seed in enumerate(seeds):
+        biased = profile.values.copy()
+        degrade_scenario_array(biased, [], [], percentage_bias, rng=np.random.default_rng(seed))
+        biased = biased[:, positions]
+
+        #One random order of the rows for noise and one for missing values, and a noise value per row, per node
+        ranks_noise = np.empty(full.shape, dtype=int)
+        ranks_missing = np.empty(full.shape, dtype=int)
+        standard_normal = np.empty(full.shape)
+        for node in range(len(names_nodes)):
+            rng = np.random.default_rng([seed, node])
+            ranks_noise[:, node] = rng.permutation(rows)
+            standard_normal[:, node] = rng.standard_normal(rows)
+            ranks_missing[:, node] = rng.permutation(rows)
+        noisy_values = shift_numbers(biased, percentage_noise_width, standard_normal)
+
+        for index_noise, count_noise in enumerate(counts_noise):
+            noisy = np.where(ranks_noise < count_noise, noisy_values, biased)
+            for index_missing, count_missing in enumerate(counts_missing):
+                degraded = np.where(ranks_missing < count_missing, np.nan, noisy)
+                statistics = visibility_statistics(full, degraded, full_constants)
+                scv[index_seed, :, index_noise, index_missing] = finalize_visibility(statistics)[2]
+
+    return NodeResponseCurves(scv, names_nodes, levels_nodes, levels_noise, levels_missing,
+                              profile.inventory_weights(names_nodes), seeds, percentage_bias)
+
+def improvement_cost(levels_noise, levels_missing, current_noise, current_missing, cost_noise=1.0, cost_missing=1.0):
+    """ Cost of bringing every node from its current percentages of noise and missing values to each level of the
+    grid: the reduction of the percentage times the cost per unit of percentage of the node (a number for all nodes
+    or a list per node). Levels above the current percentages cost nothing.
+
+    Returns an array shaped (node, noise level, missing level). """
+    levels_noise = np.asarray(levels_noise, dtype=float)
+    levels_missing = np.asarray(levels_missing, dtype=float)
+    current_noise = np.asarray(current_noise, dtype=float)[:, np.newaxis, np.newaxis]
+    current_missing = np.asarray(current_missing, dtype=float)[:, np.newaxis, np.newaxis]
+    cost_noise = np.broadcast_to(cost_noise, current_noise.shape[:1])[:, np.newaxis, np.newaxis]
+    cost_missing = np.broadcast_to(cost_missing, current_missing.shape[:1])[:, np.newaxis, np.newaxis]
+
+    return cost_noise * np.maximum(current_noise - levels_noise[:, np.newaxis], 0) + \
+        cost_missing * np.maximum(current_missing - levels_missing[np.newaxis, :], 0)
+
+def _prune_front(costs, values, budget, tolerance):
+    """ Positions of the points that are on the Pareto front of cost against value, ordered by cost: no other point
+    costs at most as much and has a value that is more than the tolerance higher. """
+    order = np.lexsort((-values, costs))
+    if budget is not None:
+        order = order[costs[order] <= budget]
+    best = np.maximum.accumulate(values[order])
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = values[order][1:] > best[:-1] + tolerance
+    return order[keep]
+
+def pareto_front(curves, costs, budget=None, confidence=0.95, tolerance=1e-6):
+    """ Pareto front of the cost against the expected global visibility over the vectors of percentages of noise
+    and missing values per node of the response curves (see `node_response_curves`), for the costs per node and
+    level (see `improvement_cost`). The expected global visibility is the sum of the weighted mean visibility of the
+    nodes, so the front follows exactly from adding the nodes one at a time and keeping the front of the partial
+    vectors, instead of evaluating every vector. Vectors that cost more than the budget are left out; points that
+    improve the visibility by at most the tolerance are not kept.
+
+    Returns a data frame ordered by cost with the cost, the expected global visibility, the half-width of its
+    confidence interval over the seeds and the percentages of noise ("noise") and missing values ("missing") per
+    node, which can be used as scenario of `run_scenario_sweep`. The data frame is empty when no vector fits the
+    budget. """
+    costs = np.asarray(costs, dtype=float)
+    contribution = curves.mean * curves.weights[:, np.newaxis, np.newaxis]
+    n_missing = len(curves.levels_missing)
+
+    front_costs, front_values = np.zeros(1), np.zeros(1)
+    front_choices = np.zeros((1, 0), dtype=int)
+    for node in range(len(curves.names_nodes)):
+        #The options of the node on their own front, then all combinations with the front of the previous nodes
+        options = _prune_front(costs[node].ravel(), contribution[node].ravel(), budget, 0)
+        combined_costs = (front_costs[:, np.newaxis] + costs[node].ravel()[options]).ravel()
+        combined_values = (front_values[:, np.newaxis] + contribution[node].ravel()[options]).ravel()
+        keep = _prune_front(combined_costs, combined_values, budget, tolerance)
+        if len(keep) == 0:
+            #No vector of percentages fits the budget
+            return pd.DataFrame({"cost": np.empty(0), "expected_scv": np.empty(0), "half_width": np.empty(0),
+                                 "noise": [], "missing": []})
+
+        front_costs, front_values = combined_costs[keep], combined_values[keep]
+        front_choices = np.column_stack([front_choices[keep // len(options)], options[keep % len(options)]])
+
+    noise_index, missing_index = np.divmod(front_choices, n_missing)
+    global_scv = np.stack([curves.global_scv(noise, missing) for noise, missing in zip(noise_index, missing_index)])
+    with np.errstate(invalid="ignore"):
+        half_width = interval_quantile(confidence, len(curves.seeds)) * \
+            np.std(global_scv, axis=1, ddof=1) / np.sqrt(len(curves.seeds))
+
+    levels_noise = np.asarray(curves.levels_noise)
+    levels_missing = np.asarray(curves.levels_missing)
+    return pd.DataFrame({"cost": front_costs, "expected_scv": np.mean(global_scv, axis=1), "half_width": half_width,
+                         "noise": [levels_noise[index].tolist() for index in noise_index],
+                         "missing": [levels_missing[index].tolist() for index in missing_index]})
+
+def minimum_cost_for_target(front, target_scv):
+    """ The cheapest point of a Pareto front (see `pareto_front`) with an expected global visibility of at least the
+    target, as a scenario dictionary with the percentages of noise and missing values per node, the cost and the
+    expected visibility. Returns None when no point reaches the target. """
+    reached = front[front["expected_scv"] >= target_scv]
+    if reached.empty:
+        return None
+    return reached.iloc[0].to_dict()
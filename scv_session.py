@@ -0,0 +1,101 @@
+import numpy as np
+
+from calculate_scv import NodeResult, degrade_scenario_array, finalize_visibility, visibility_statistics
+from degrade_data.noise_data import noise_in_numbers
+from ground_truth import GroundTruthProfile
+
+
+class SCVSession(object):
+    """ Supply chain visibility that is kept up to date while the degradation of one node at a time changes, e.g.
+    for what-if analyses in a dashboard. The session keeps the degraded column and the score of every node. When
+    the percentage of noise or missing values of one node changes, only that node is degraded and scored again and
+    the inventory-weighted global visibility is updated in O(1).
+
+    Every node draws from its own random stream, derived from the seed and the position of the node, so a node
+    gets the same degradation for the same percentages whatever happens to the other nodes. The bias is applied to
+    the rows of the whole data set once, as in `degrade_scenario_array`; changing it degrades all nodes again. """
+
+    def __init__(self, data_set, names_nodes, levels_nodes, percentages_noise=None, percentages_missing=None,
+                 percentage_bias=0.25, seed=2, percentage_noise_width=1):
+        self.profile = data_set if isinstance(data_set, GroundTruthProfile) else GroundTruthProfile(data_set)
+        self.names_nodes = list(names_nodes)
+        self.levels_nodes = list(levels_nodes)
+        self.seed = seed
+        self.percentage_noise_width = percentage_noise_width
+
+        self.percentages_noise = list(percentages_noise) if percentages_noise is not None else \
+            [0] * len(self.names_nodes)
+        self.percentages_missing = list(percentages_missing) if percentages_missing is not None else \
+            [0] * len(self.names_nodes)
+
+        self._positions = [self.profile.columns.index(name) for name in self.names_nodes]
+        self._full = self.profile.values[:, self._positions]
+        self._full_constants = self.profile.node_constants(self.names_nodes)
+        self._weights = self.profile.inventory_weights(self.names_nodes)
+
+        self.set_bias(percentage_bias)
+
+    def set_bias(self, percentage_bias):
+        """ Apply a new percentage of bias to the data set and degrade and score all nodes again. """
+        self.percentage_bias = percentage_bias
+
+        biased = self.profile.values.copy()
+        degrade_scenario_array(biased, [], [], percentage_bias, rng=np.random.default_rng(self.seed))
+        self._biased = biased[:, self._positions]
+
+        self._degraded = np.empty_like(self._full)
+        for node in range(len(self.names_nodes)):
+            self._degrade_node(node)
+
+        statistics = visibility_statistics(self._full, self._degraded, self._full_constants)
+        self.quantity, self.quality, self.scv_nodes, self.average_inventory = finalize_visibility(statistics)
+        self.scv = float(np.sum(self.scv_nodes * self._weights))
+
+        return self.scv
+
+    def set_node(self, name, noise=None, missing=None):
+        """ Change the percentage of noise and/or missing values of one node, degrade and score only that node and
+        update the global visibility. Returns the new global visibility. """
+        node = self.names_nodes.index(name)
+        if noise is not None:
+            self.percentages_noise[node] = noise
+        if missing is not None:
+            self.percentages_missing[node] = missing
+
+        self._degrade_node(node)
+
+        statistics = visibility_statistics(self._full[:, [node]], self._degraded[:, [node]],
+                                           {key: value[[node]] for key, value in self._full_constants.items()})
+        quantity, quality, scv, average_inventory = finalize_visibility(statistics)
+
+        self.scv += self._weights[node] * (scv[0] - self.scv_nodes[node])
+        self.quantity[node], self.quality[node], self.scv_nodes[node] = quantity[0], quality[0], scv[0]
+
+        return self.scv
+
+    def _degrade_node(self, node):
+        """ Noise and then missing values on the biased column of one node, from the random stream of the node. """
+        rng = np.random.default_rng([self.seed, node])
+        column = self._biased[:, node].copy()
+        rows = len(column)
+
+        rows_noise = np.sort(rng.choice(rows, size=int(round(self.percentages_noise[node]*rows)), replace=False))
+        column[rows_noise] = noise_in_numbers(column[rows_noise], self.percentage_noise_width, rng)
+
+        rows_missing = rng.choice(rows, size=int(round(self.percentages_missing[node]*rows)), replace=False)
+        column[rows_missing] = np.nan
+
+        self._degraded[:, node] = column
+
+    @property
+    def nodes(self):
+        """ The current score of every node as a `NodeResult`. """
+        return [NodeResult(*node) for node in zip(self.names_nodes, self.levels_nodes, self.quantity.tolist(),
+                                                  self.quality.tolist(), self.scv_nodes.tolist(),
+                                                  self.average_inventory.tolist())]
+
+    def degraded_frame(self):
+        """ The current degraded data set of the nodes as a data frame. """
+        frame = self.profile.frame[self.names_nodes].copy()
+        frame[:] = self._degraded
+        return frame
@@ -0,0 +1,194 @@
+import numpy as np
+import pandas as pd
+from statistics import NormalDist
+
+try:
+    from scipy import stats
+except ImportError:
+    stats = None
+
+#Fields of the result of a node for one scenario and seed
+NODE_DTYPE = np.dtype([("scv", np.float32), ("quality", np.float32), ("quantity", np.float32),
+                       ("weight", np.float32)])
+
+
+def interval_quantile(confidence, count):
+    """ Quantile of the confidence interval of a mean over count values: of the Student t distribution when scipy is
+    installed and otherwise of the Normal distribution. """
+    if stats is not None:
+        return stats.t.ppf(0.5 + confidence / 2, np.maximum(np.asarray(count) - 1, 1))
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+class RunningStatistics(object):
+    """ Running count, mean and sum of squared deviations (Welford) of values that arrive in batches, per element of
+    an array of the given shape. A batch is merged with the update of Chan et al., so the statistics do not depend
+    on the size of the batches; NaN values are left out. """
+
+    def __init__(self, shape=()):
+        self.count = np.zeros(shape)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def update(self, values):
+        """ Add a batch of values shaped (values, *shape). """
+        values = np.asarray(values, dtype=float)
+        valid = ~np.isnan(values)
+        count = np.sum(valid, axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(count > 0, np.nansum(values, axis=0) / count, 0.0)
+            m2 = np.nansum(np.where(valid, values - mean, np.nan) ** 2, axis=0)
+
+            total = self.count + count
+            delta = mean - self.mean
+            self.mean = np.where(total > 0, self.mean + delta * count / total, 0.0)
+            self.m2 = np.where(total > 0, self.m2 + m2 + delta ** 2 * self.count * count / total, 0.0)
+        self.count = total
+
+    def variance(self, ddof=1):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.count > ddof, self.m2 / (self.count - ddof), np.nan)
+
+    def half_width(self, confidence=0.95):
+        """ Half of the width of the confidence interval of the mean (see `interval_quantile`). """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return interval_quantile(confidence, self.count) * np.sqrt(self.variance() / self.count)
+
+
+class SweepResult(object):
+    """ Results of a sweep over scenarios and seeds in two arrays instead of a `Node` per node, seed and scenario:
+    a structured array shaped (scenario, seed, node) with the float32 fields "scv", "quality", "quantity" and
+    "weight" (the normalized average inventory), and the global visibility shaped (scenario, seed) in float64. Seeds
+    that were not run are NaN. The aggregation helpers reduce over the seeds and return an array per scenario (and
+    node), for the global visibility with field "global_scv" or for a field of the nodes.
+
+    A sweep with a precision target (see `run_scenario_sweep`) also sets the achieved half-width of the confidence
+    interval of the mean global visibility per scenario ("half_width"), of the mean visibility per scenario and node
+    ("half_width_nodes") and whether the scenario reached the target ("converged"); `count` gives the number of seeds
+    that were run.
+
+    For compatibility, `result[name]` returns the dictionary of a scenario that `run_scenario_sweep` used to return
+    (see `to_dict`). """
+
+    def __init__(self, scenarios, seeds, names_nodes, levels_nodes, nodes=None, global_scv=None,
+                 average_inventory=None):
+        self.scenarios = list(scenarios)
+        self.seeds = list(seeds)
+        self.names_nodes = list(names_nodes)
+        self.levels_nodes = list(levels_nodes)
+        self.average_inventory = average_inventory
+
+        shape = (len(self.scenarios), len(self.seeds), len(self.names_nodes))
+        if nodes is None:
+            nodes = np.full(shape, np.nan, dtype=NODE_DTYPE)
+        if global_scv is None:
+            global_scv = np.full(shape[:2], np.nan)
+        self.nodes = nodes
+        self.global_scv = global_scv
+
+        self.half_width = None
+        self.half_width_nodes = None
+        self.converged = None
+
+    def set(self, scenario, seed, quantity, quality, scv, weight, global_scv):
+        """ Store the result of one scenario and seed, by position. """
+        self.nodes["quantity"][scenario, seed] = quantity
+        self.nodes["quality"][scenario, seed] = quality
+        self.nodes["scv"][scenario, seed] = scv
+        self.nodes["weight"][scenario, seed] = weight
+        self.global_scv[scenario, seed] = global_scv
+
+    def field(self, field="global_scv"):
+        """ Global visibility shaped (scenario, seed) or a field of the nodes shaped (scenario, seed, node). """
+        if field == "global_scv":
+            return self.global_scv
+        return self.nodes[field].astype(float)
+
+    def count(self, field="global_scv"):
+        """ Number of seeds with a result. """
+        return np.sum(~np.isnan(self.field(field)), axis=1)
+
+    def mean(self, field="global_scv"):
+        return np.nanmean(self.field(field), axis=1)
+
+    def std(self, field="global_scv", ddof=1):
+        return np.nanstd(self.field(field), axis=1, ddof=ddof)
+
+    def boxplot_stats(self, field="global_scv", whisker=1.5):
+        """ Statistics of a box plot over the seeds: the quartiles, the mean and the whiskers, which reach the most
+        extreme values within whisker times the interquartile range from the box. """
+        values = self.field(field)
+        q1, median, q3 = np.nanpercentile(values, [25, 50, 75], axis=1)
+        iqr = q3 - q1
+
+        low = np.expand_dims(q1 - whisker * iqr, 1)
+        high = np.expand_dims(q3 + whisker * iqr, 1)
+        with np.errstate(invalid="ignore"):
+            inside = (values >= low) & (values <= high)
+        return {"q1": q1, "median": median, "q3": q3, "mean": np.nanmean(values, axis=1),
+                "whisker_low": np.nanmin(np.where(inside, values, np.nan), axis=1),
+                "whisker_high": np.nanmax(np.where(inside, values, np.nan), axis=1)}
+
+    def confidence_interval(self, field="global_scv", confidence=0.95):
+        """ Confidence interval of the mean over the seeds, with the Student t distribution when scipy is installed
+        and otherwise the Normal distribution. Returns the lower and upper bound. """
+        count = self.count(field)
+        mean = self.mean(field)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            standard_error = self.std(field) / np.sqrt(count)
+
+        quantile = interval_quantile(confidence, count)
+        return mean - quantile * standard_error, mean + quantile * standard_error
+
+    def to_frame(self):
+        """ Data frame with a row per scenario, seed and node and a column per field, plus the global visibility. """
+        scenarios, seeds, nodes = np.indices(self.nodes.shape).reshape(3, -1)
+        frame = pd.DataFrame({"scenario": np.asarray(self.scenarios, dtype=object)[scenarios],
+                              "seed": np.asarray(self.seeds)[seeds],
+                              "node": np.asarray(self.names_nodes, dtype=object)[nodes]})
+        for name in NODE_DTYPE.names:
+            frame[name] = self.nodes[name].reshape(-1)
+        frame["global_scv"] = self.global_scv[scenarios, seeds]
+        return frame
+
+    def to_dict(self, name_scenario):
+        """ Dictionary of one scenario with the global visibility and a `NodeResult` per node per seed, the list of
+        the global visibility per seed ("list_scv_per_seed") and its mean ("mean_global_scv"). """
+        from calculate_scv import NodeResult #calculate_scv returns a SweepResult
+
+        average_inventory = self.average_inventory
+        if average_inventory is None:
+            average_inventory = [np.nan] * len(self.names_nodes)
+
+        scenario = self.scenarios.index(name_scenario)
+        results = {}
+        for position, seed in enumerate(self.seeds):
+            if np.isnan(self.global_scv[scenario, position]):
+                continue
+            nodes = self.nodes[scenario, position]
+            results[seed] = {"global_scv": float(self.global_scv[scenario, position]),
+                             "nodes": [NodeResult(*node) for node in zip(self.names_nodes, self.levels_nodes,
+                                                                         nodes["quantity"].tolist(),
+                                                                         nodes["quality"].tolist(),
+                                                                         nodes["scv"].tolist(),
+                                                                         list(average_inventory))]}
+
+        results["list_scv_per_seed"] = [results[seed]["global_scv"] for seed in self.seeds if seed in results]
+        results["mean_global_scv"] = np.mean(results["list_scv_per_seed"])
+        return results
+
+    def __getitem__(self, name_scenario):
+        return self.to_dict(name_scenario)
+
+    def __iter__(self):
+        return iter(self.scenarios)
+
+    def items(self):
+        return [(name, self.to_dict(name)) for name in self.scenarios]
+
+    def __len__(self):
+        return len(self.scenarios)
+
+    @property
+    def nbytes(self):
+        return self.nodes.nbytes + self.global_scv.nbytes
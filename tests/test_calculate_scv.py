@@ -0,0 +1,16 @@
+import numpy as np
+
+from calculate_scv import calculate_scv_batch
+
+
+def test_calculate_scv_batch_accepts_nested_lists():
+    rng = np.random.default_rng(0)
+    ground_truths = rng.gamma(2.0, 50.0, size=(2, 3, 20, 4))
+    degraded = np.repeat(ground_truths[:, :, np.newaxis], 5, axis=2)
+    degraded[..., ::3, 1] = np.nan
+
+    expected = calculate_scv_batch(ground_truths, degraded)
+    result = calculate_scv_batch(ground_truths.tolist(), degraded.tolist())
+
+    assert result.shape == (2, 3, 5)
+    np.testing.assert_allclose(result, expected)
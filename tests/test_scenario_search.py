@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from scenario_search import improvement_cost, minimum_cost_for_target, node_response_curves, pareto_front
+
+LEVELS_NOISE = [0, 0.2, 0.5]
+LEVELS_MISSING = [0, 0.3, 0.6]
+
+
+def ground_truth(rows=50, actors=3):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(rng.gamma(2.0, 50.0, size=(rows, actors)),
+                        columns=["Actor_{0}".format(actor) for actor in range(actors)])
+
+def curves_and_costs():
+    data_set = ground_truth()
+    names_nodes = list(data_set.columns)
+    curves = node_response_curves(data_set, names_nodes, [1] * len(names_nodes), LEVELS_NOISE, LEVELS_MISSING,
+                                  seeds=range(1, 4))
+    #Every option of the first node costs at least 1, also keeping the current percentages
+    costs = improvement_cost(LEVELS_NOISE, LEVELS_MISSING, [0.5] * 3, [0.6] * 3) + \
+        np.array([1.0, 0.0, 0.0])[:, np.newaxis, np.newaxis]
+    return curves, costs
+
+
+def test_pareto_front_is_increasing():
+    curves, costs = curves_and_costs()
+    front = pareto_front(curves, costs)
+
+    assert len(front) > 0
+    assert np.all(np.diff(front["cost"]) > 0)
+    assert np.all(np.diff(front["expected_scv"]) > 0)
+
+def test_pareto_front_without_feasible_scenario():
+    curves, costs = curves_and_costs()
+    front = pareto_front(curves, costs, budget=0.5)
+
+    assert front.empty
+    assert list(front.columns) == ["cost", "expected_scv", "half_width", "noise", "missing"]
+    assert minimum_cost_for_target(front, 0) is None
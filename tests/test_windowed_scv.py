@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from calculate_scv import degrade_scenario_array
+from windowed_scv import RollingSCV, SCVAccumulator, rolling_visibility, windowed_scenario_visibility
+
+NAMES = ["a", "b", "c", "d"]
+LEVELS = [1, 2, 2, 3]
+NOISE = [0.1, 0.2, 0.0, 0.3]
+MISSING = [0.05, 0.0, 0.4, 0.1]
+
+
+def degraded_pair(rows, actors=4, seed=0):
+    rng = np.random.default_rng(seed)
+    full = pd.DataFrame(rng.gamma(2.0, 50.0, size=(rows, actors)),
+                        columns=["Actor_{0}".format(actor) for actor in range(actors)])
+    degraded = full * (1 + 0.2 * rng.standard_normal(full.shape))
+    degraded = degraded.mask(rng.random(full.shape) < 0.3)
+    return full, degraded
+
+def trending_series(rows=4000, seed=5):
+    rng = np.random.default_rng(seed)
+    trend = np.linspace(10, 500, rows)[:, np.newaxis]
+    values = np.round(trend * rng.gamma(2.0, 0.5, size=(rows, len(NAMES)))) * (rng.random((rows, len(NAMES))) > 0.1)
+    return pd.DataFrame(values, columns=NAMES)
+
+def feed(full, degraded, window, size):
+    rolling = RollingSCV(list(full.columns), window)
+    updates = [rolling.update(full.to_numpy()[start:start + size], degraded.to_numpy()[start:start + size])
+               for start in range(0, len(full), size)]
+    return np.concatenate([scv for scv, global_scv in updates]), \
+        np.concatenate([global_scv for scv, global_scv in updates])
+
+
+@pytest.mark.parametrize("size", [1, 7, 29, 30, 100])
+@pytest.mark.parametrize("window, rows", [(30, 200), (30, 20), (1, 50), (5, 5)])
+def test_rolling_feed_equals_rolling_visibility(window, rows, size):
+    full, degraded = degraded_pair(rows)
+    expected = rolling_visibility(full, degraded, list(full.columns), window)
+
+    scv, global_scv = feed(full, degraded, window, size)
+
+    np.testing.assert_allclose(scv, expected[list(full.columns)].to_numpy(), rtol=1e-9, atol=1e-9, equal_nan=True)
+    np.testing.assert_allclose(global_scv, expected["global"].to_numpy(), rtol=1e-9, atol=1e-9, equal_nan=True)
+    assert np.isnan(global_scv[:window - 1]).all()
+    assert not np.isnan(global_scv[window - 1:]).any()
+
+@pytest.mark.parametrize("window", [0, -3])
+def test_window_below_one_raises(window):
+    full, degraded = degraded_pair(10)
+    with pytest.raises(ValueError):
+        rolling_visibility(full, degraded, list(full.columns), window)
+    with pytest.raises(ValueError):
+        RollingSCV(list(full.columns), window)
+
+@pytest.mark.parametrize("block_size", [4000, 1000, 64])
+def test_windowed_realised_counts_do_not_depend_on_block_size(tmp_path, block_size):
+    full = trending_series()
+    data_file = tmp_path / "full.csv"
+    full.to_csv(data_file, index=False)
+
+    accumulator = windowed_scenario_visibility(data_file, NOISE, MISSING, NAMES, LEVELS, seed=3,
+                                               block_size=block_size)
+    np.testing.assert_array_equal(accumulator.statistics["degraded_count"],
+                                  len(full) - np.round(np.array(MISSING) * len(full)))
+
+    #Noise leaves zeros unchanged
+    degraded_file = tmp_path / "degraded.csv"
+    windowed_scenario_visibility(full + 1, NOISE, [0] * len(NAMES), NAMES, LEVELS, percentage_bias=0, seed=3,
+                                 block_size=block_size, degraded_file=degraded_file)
+    changed = (pd.read_csv(degraded_file).to_numpy() != full.to_numpy() + 1).sum(axis=0)
+    np.testing.assert_array_equal(changed, np.round(np.array(NOISE) * len(full)))
+
+    degraded_file = tmp_path / "biased.csv"
+    windowed_scenario_visibility(full, [0] * len(NAMES), [0] * len(NAMES), NAMES, LEVELS, percentage_bias=0.25,
+                                 seed=3, block_size=block_size, degraded_file=degraded_file)
+    changed = (pd.read_csv(degraded_file).to_numpy() != full.to_numpy()).any(axis=1).sum()
+    assert 0.2 * len(full) < changed <= 0.25 * len(full)
+
+def test_windowed_global_scv_does_not_depend_on_block_size():
+    full = trending_series()
+    seeds = range(8)
+    in_memory = []
+    for seed in seeds:
+        degraded = degrade_scenario_array(full.to_numpy(dtype=float, copy=True), NOISE, MISSING, 0.25,
+                                          rng=np.random.default_rng(seed), bias_columns=np.arange(len(NAMES)))
+        accumulator = SCVAccumulator(NAMES, LEVELS)
+        accumulator.add(full.to_numpy(dtype=float), degraded)
+        in_memory.append(accumulator.global_scv)
+
+    for block_size in [4000, 1000, 64]:
+        windowed = [windowed_scenario_visibility(full, NOISE, MISSING, NAMES, LEVELS, seed=seed,
+                                                 block_size=block_size).global_scv for seed in seeds]
+        assert abs(np.mean(windowed) - np.mean(in_memory)) < 1.0
@@ -0,0 +1,271 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from itertools import zip_longest
+
+from calculate_scv import NodeResult, finalize_visibility, visibility_statistics, weight_visibility
+from degrade_data.noise_data import noise_in_numbers
+from ground_truth import GroundTruthProfile
+
+
+def iter_blocks(data_set, names_nodes, block_size=100000):
+    """ Generator of blocks of at most block_size rows of the columns of the nodes, as 2-D float arrays in the order
+    of the names. The data set is the name of a csv file, which is read in chunks so that only one block is held in
+    memory, a data frame or a `GroundTruthProfile`. """
+    names_nodes = list(names_nodes)
+    if isinstance(data_set, (str, os.PathLike)):
+        for chunk in pd.read_csv(data_set, usecols=names_nodes, dtype={name: "float64" for name in names_nodes},
+                                 chunksize=block_size):
+            yield chunk[names_nodes].to_numpy(dtype=float)
+        return
+
+    if isinstance(data_set, GroundTruthProfile):
+        data_set = data_set.frame
+    frame = data_set[names_nodes]
+    for start in range(0, len(frame), block_size):
+        yield frame.iloc[start:start + block_size].to_numpy(dtype=float)
+
+
+class SCVAccumulator(object):
+    """ Supply chain visibility of a data set that arrives in blocks of rows. The accumulator keeps, per node, the
+    sums of `visibility_statistics`: the number of values in the full and the degraded data set, the number of
+    values present in both, the sum of the actual values and of the absolute errors, and the sum of the inventory.
+    These are additive over the rows, so the visibility after all blocks equals the visibility of the whole data set
+    at once, while the memory only depends on the size of a block. """
+
+    def __init__(self, names_nodes, levels_nodes):
+        self.names_nodes = list(names_nodes)
+        self.levels_nodes = list(levels_nodes)
+        self.statistics = None
+        self.rows = 0
+
+    def add(self, full_values, degraded_values):
+        """ Add a block of the full and the degraded data set, 2-D float arrays with a column per node. """
+        statistics = visibility_statistics(full_values, degraded_values)
+        if self.statistics is None:
+            self.statistics = statistics
+        else:
+            for key, value in statistics.items():
+                self.statistics[key] = self.statistics[key] + value
+        self.rows += len(full_values)
+        return self
+
+    def merge(self, other):
+        """ Add the statistics of another accumulator over other rows, e.g. of another worker. """
+        if other.statistics is not None:
+            if self.statistics is None:
+                self.statistics = dict(other.statistics)
+            else:
+                for key, value in other.statistics.items():
+                    self.statistics[key] = self.statistics[key] + value
+        self.rows += other.rows
+        return self
+
+    def finalize(self):
+        """ Quantity, quality, visibility and average inventory per node (see `finalize_visibility`). """
+        return finalize_visibility(self.statistics)
+
+    @property
+    def global_scv(self):
+        quantity, quality, scv, average_inventory = self.finalize()
+        return float(weight_visibility(scv, average_inventory))
+
+    @property
+    def nodes(self):
+        """ The score of every node as a `NodeResult`. """
+        quantity, quality, scv, average_inventory = self.finalize()
+        return [NodeResult(*node) for node in zip(self.names_nodes, self.levels_nodes, quantity.tolist(),
+                                                  quality.tolist(), scv.tolist(), average_inventory.tolist())]
+
+
+def windowed_scv_degraded(full_data_set, data_set, names_nodes, levels_nodes, block_size=100000):
+    """ Calculate the supply chain visibility of an already degraded data set against the full data set block by
+    block (see `iter_blocks`), with the rows of both data sets in the same order. The result equals
+    `calculate_scv_degraded` up to rounding. Raises a ValueError when the data sets do not have the same number of
+    rows. Returns the global visibility and a `NodeResult` per node. """
+    accumulator = SCVAccumulator(names_nodes, levels_nodes)
+    for full_values, degraded_values in zip_longest(iter_blocks(full_data_set, names_nodes, block_size),
+                                                    iter_blocks(data_set, names_nodes, block_size)):
+        if full_values is None or degraded_values is None or len(full_values) != len(degraded_values):
+            raise ValueError("The full and the degraded data set do not have the same number of rows")
+        accumulator.add(full_values, degraded_values)
+
+    return accumulator.global_scv, accumulator.nodes
+
+def _block_lengths(data_set, names_nodes, block_size):
+    """ Number of rows of each block of `iter_blocks`; a csv file is read once, for one column only. """
+    if isinstance(data_set, (str, os.PathLike)):
+        return np.array([len(chunk) for chunk in pd.read_csv(data_set, usecols=[names_nodes[0]],
+                                                             chunksize=block_size)], dtype=np.int64)
+    rows = len(data_set.frame if isinstance(data_set, GroundTruthProfile) else data_set)
+    return np.array([min(block_size, rows - start) for start in range(0, rows, block_size)], dtype=np.int64)
+
+def _block_rng(seed, position, stream):
+    """ Random stream of one block: 0 for the LogNormal weights of the rows, 1 for the rows that are sampled for the
+    bias and 2 for the degradation of the block. """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(position, stream)))
+
+def _degradation_plan(lengths, percentages_noise, percentages_missing, percentage_bias, seed):
+    """ Numbers of biased rows, sampled rows and noisy and missing values per block for the degradation of the whole
+    data set. The totals are those of `degrade_scenario_array` over all rows. Cells chosen without replacement from
+    all rows are split over the blocks with a multivariate hypergeometric draw. Rows sampled with replacement in
+    proportion to their LogNormal weight are split with a multinomial draw over the sums of the weights per block.
+    The slots pair the sampled rows with the biased rows in random order. """
+    rng = np.random.default_rng(np.random.SeedSequence(seed))
+    rows = int(np.sum(lengths))
+
+    count_bias = round(rows*percentage_bias)
+    weight_sums = np.array([_block_rng(seed, position, 0).lognormal(size=length).sum()
+                            for position, length in enumerate(lengths)])
+    return {"biased": rng.multivariate_hypergeometric(lengths, count_bias),
+            "sampled": rng.multinomial(count_bias, weight_sums / weight_sums.sum()),
+            "slots": rng.permutation(count_bias),
+            "noise": np.array([rng.multivariate_hypergeometric(lengths, int(round(percentage*rows)))
+                               for percentage in percentages_noise], dtype=np.int64).reshape(-1, len(lengths)).T,
+            "missing": np.array([rng.multivariate_hypergeometric(lengths, int(round(percentage*rows)))
+                                 for percentage in percentages_missing], dtype=np.int64).reshape(-1, len(lengths)).T}
+
+def windowed_scenario_visibility(data_set, percentages_noise, percentages_missing, names_nodes, levels_nodes,
+                                 percentage_bias=0.25, seed=2, block_size=100000, percentage_noise_width=1,
+                                 bias_columns=None, degraded_file=None):
+    """ Degrade and score a data set for a scenario block by block (see `iter_blocks`), so that a long time series
+    does not have to fit in memory. The degradation has the same distribution as degrading the whole data set at
+    once with `degrade_scenario_array`: bias on the rows, then noise and then missing values with a percentage per
+    node. The numbers of biased rows and of noisy and missing values per node are those of the whole data set,
+    split over the blocks (see `_degradation_plan`), and the biased rows are overwritten by rows sampled from the
+    whole data set. The realised percentages and the expected global visibility therefore do not depend on the
+    block size, only the random draws do. The bias applies to the bias columns, positions in the names of the
+    nodes, by default all nodes. When a file name is given, the degraded blocks are written to it as csv.
+
+    A csv file is read once to count the rows and, with bias, once more to collect the sampled rows in a temporary
+    file on disk. The memory holds one block and the order in which the sampled rows replace the biased rows.
+
+    Returns the `SCVAccumulator` with the global visibility and the nodes. """
+    names_nodes = list(names_nodes)
+    accumulator = SCVAccumulator(names_nodes, levels_nodes)
+    if bias_columns is None:
+        bias_columns = np.arange(len(names_nodes))
+    lengths = _block_lengths(data_set, names_nodes, block_size)
+    plan = _degradation_plan(lengths, percentages_noise, percentages_missing, percentage_bias, seed)
+
+    with tempfile.TemporaryFile() as sampled_file:
+        #First pass: the rows sampled for the bias, by block, in the order of the slots
+        sampled = None
+        if len(plan["slots"]) > 0:
+            sampled = np.memmap(sampled_file, dtype=np.float64, mode="w+", shape=(len(plan["slots"]),
+                                                                                   len(names_nodes)))
+            start = 0
+            for position, full_values in enumerate(iter_blocks(data_set, names_nodes, block_size)):
+                count = plan["sampled"][position]
+                if count > 0:
+                    lognormal = _block_rng(seed, position, 0).lognormal(size=len(full_values))
+                    rows = _block_rng(seed, position, 1).choice(len(full_values), size=count, replace=True,
+                                                                p=lognormal/lognormal.sum())
+                    sampled[start:start + count] = full_values[rows]
+                    start += count
+
+        #Second pass: bias, noise and missing values per block
+        start = 0
+        for position, full_values in enumerate(iter_blocks(data_set, names_nodes, block_size)):
+            rng = _block_rng(seed, position, 2)
+            rows = len(full_values)
+            degraded_values = full_values.copy()
+
+            count = plan["biased"][position]
+            if count > 0:
+                replace = rng.choice(rows, size=count, replace=False)
+                slots = plan["slots"][start:start + count]
+                degraded_values[np.ix_(replace, bias_columns)] = sampled[slots][:, bias_columns]
+                start += count
+
+            for column, count in enumerate(plan["noise"][position]):
+                rows_noise = np.sort(rng.choice(rows, size=count, replace=False))
+                degraded_values[rows_noise, column] = noise_in_numbers(degraded_values[rows_noise, column],
+                                                                       percentage_noise_width, rng)
+            for column, count in enumerate(plan["missing"][position]):
+                degraded_values[rng.choice(rows, size=count, replace=False), column] = np.nan
+
+            accumulator.add(full_values, degraded_values)
+            if degraded_file is not None:
+                pd.DataFrame(degraded_values, columns=names_nodes).to_csv(degraded_file, index=False,
+                                                                          mode="w" if position == 0 else "a",
+                                                                          header=position == 0)
+
+    return accumulator
+
+def _window_sums(statistics, window, offset=0):
+    """ Sums of the statistics per row over the window of rows that ends at each row, from the cumulative sums. The
+    first offset rows only precede the rows of interest; the sums are returned for the other rows. """
+    sums = {}
+    for key, value in statistics.items():
+        cumulative = np.concatenate([np.zeros((1,) + value.shape[1:]), np.cumsum(value, axis=0)])
+        end = np.arange(offset + 1, len(cumulative))
+        sums[key] = cumulative[end] - cumulative[np.maximum(end - window, 0)]
+    return sums
+
+def _row_statistics(full_values, degraded_values):
+    """ The statistics of `visibility_statistics` of every row on its own, shaped (row, node). """
+    return visibility_statistics(full_values[:, np.newaxis, :], degraded_values[:, np.newaxis, :])
+
+def rolling_visibility(full_data_set, data_set, names_nodes, window=30):
+    """ Supply chain visibility over a rolling window of time steps: for each time step, the visibility of every
+    node and the global visibility of the window of rows that ends at that time step, as if the data sets only held
+    those rows (the weights are the average inventory within the window). The statistics per row are summed over
+    the windows with cumulative sums, so all windows take O(T) instead of scoring each window again. The rows of
+    both data sets are in the same order; the first window - 1 time steps are NaN, as with `pandas.rolling`. Raises a
+    ValueError when the window is less than one time step.
+
+    Returns a data frame with the index of the full data set, the visibility per node and the global visibility
+    ("global"). """
+    if window < 1:
+        raise ValueError("The window must be at least one time step, not {0}".format(window))
+    full_frame = full_data_set.frame if isinstance(full_data_set, GroundTruthProfile) else full_data_set
+    statistics = _row_statistics(full_frame[names_nodes].to_numpy(dtype=float),
+                                 data_set[names_nodes].to_numpy(dtype=float))
+    quantity, quality, scv, average_inventory = finalize_visibility(_window_sums(statistics, window))
+
+    frame = pd.DataFrame(scv, index=full_frame.index, columns=list(names_nodes))
+    with np.errstate(divide="ignore", invalid="ignore"): #windows without inventory
+        frame["global"] = weight_visibility(scv, average_inventory)
+    frame.iloc[:window - 1] = np.nan
+    return frame
+
+
+class RollingSCV(object):
+    """ Rolling supply chain visibility of a live feed, e.g. of a running simulation: new time steps of the full and
+    the degraded data set are added with `update`, which returns the visibility of the window that ends at each new
+    time step (see `rolling_visibility`). Only the statistics of the last window - 1 time steps are kept, so an
+    update takes O(window + new time steps) whatever the length of the feed. """
+
+    def __init__(self, names_nodes, window=30):
+        if window < 1:
+            raise ValueError("The window must be at least one time step, not {0}".format(window))
+        self.names_nodes = list(names_nodes)
+        self.window = window
+        self.steps = 0
+        self._statistics = None
+
+    def update(self, full_values, degraded_values):
+        """ Add one or more time steps, as arrays with a column per node (a 1-D array is one time step). Returns the
+        visibility per new time step and node and the global visibility per new time step; NaN until the first
+        window is complete. """
+        full_values = np.atleast_2d(np.asarray(full_values, dtype=float))
+        degraded_values = np.atleast_2d(np.asarray(degraded_values, dtype=float))
+        statistics = _row_statistics(full_values, degraded_values)
+
+        offset = 0
+        if self._statistics is not None:
+            offset = len(self._statistics["full_count"])
+            statistics = {key: np.concatenate([self._statistics[key], value]) for key, value in statistics.items()}
+        quantity, quality, scv, average_inventory = finalize_visibility(_window_sums(statistics, self.window, offset))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            global_scv = weight_visibility(scv, average_inventory)
+
+        incomplete = np.arange(self.steps, self.steps + len(full_values)) < self.window - 1
+        scv[incomplete] = np.nan
+        global_scv[incomplete] = np.nan
+
+        self.steps += len(full_values)
+        self._statistics = {key: value[max(len(value) - self.window + 1, 0):] for key, value in statistics.items()}
+        return scv, global_scv